@@ -26,20 +26,34 @@ def main():
     if st.session_state.show_calendar:
         st.subheader("📅 Available Time Slots")
         
-        available_slots = st.session_state.agent.get_available_slots_for_ui()
+        # Optional preferences; slots come back ranked, earliest first
+        filter_cols = st.columns(2)
+        with filter_cols[0]:
+            preferred_doctor = st.selectbox("Preferred doctor", ["Any"] + st.session_state.agent.available_doctors())
+        with filter_cols[1]:
+            time_of_day = st.selectbox("Time of day", ["Any", "morning", "afternoon", "evening"])
         
-        if not available_slots:
+        filtered = time_of_day != "Any"
+        available_slots = st.session_state.agent.get_available_slots_for_ui(
+            preferred_doctor=None if preferred_doctor == "Any" else preferred_doctor,
+            time_of_day=time_of_day if filtered else None,
+        )
+        
+        if not available_slots and filtered:
+            st.info("No slots match this time of day. Try another preference.")
+        elif not available_slots:
             st.warning("No available slots found.")
             st.session_state.show_calendar = False
             st.session_state.conversation.append(("agent", "Sorry, no slots available. Please try again later."))
             st.rerun()
         
-        # Group slots by doctor
-        doctors = list(set(slot['doctor'] for slot in available_slots))
+        # Group slots by doctor, best-ranked doctor first
+        doctors = list(dict.fromkeys(slot['doctor'] for slot in available_slots))
         
         for doctor in doctors:
-            with st.expander(f"👨‍⚕️ {doctor}", expanded=True):
-                doctor_slots = [s for s in available_slots if s['doctor'] == doctor]
+            doctor_slots = [s for s in available_slots if s['doctor'] == doctor]
+            reason = doctor_slots[0].get('reason')
+            with st.expander(f"👨‍⚕️ {doctor}" + (f" ({reason})" if reason else ""), expanded=True):
                 
                 # Group by date
                 dates = list(set(slot['date'] for slot in doctor_slots))
@@ -50,7 +64,7 @@ def main():
                     
                     # Create buttons for each time slot
                     cols = st.columns(3)
-                    for i, slot in enumerate(sorted(date_slots, key=lambda x: x['time'])):
+                    for i, slot in enumerate(date_slots):
                         with cols[i % 3]:
                             if st.button(
                                 f"⏰ {slot['time']}",
@@ -62,7 +76,12 @@ def main():
                                 
                                 # Process the selected slot
                                 response = st.session_state.agent.handle_slot_selection(st.session_state.selected_slot)
-                                st.session_state.conversation.append(("agent", response))
+                                if isinstance(response, dict) and response.get("show_calendar"):
+                                    # Slot was taken by another session; pick again
+                                    st.session_state.show_calendar = True
+                                    st.session_state.conversation.append(("agent", response["message"]))
+                                else:
+                                    st.session_state.conversation.append(("agent", response))
                                 st.rerun()
         
         # Cancel button
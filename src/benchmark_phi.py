@@ -0,0 +1,240 @@
+import os
+import sys
+import time
+import random
+import statistics
+import tempfile
+import subprocess
+from datetime import date, timedelta
+
+import pandas as pd
+
+import phi_crypto
+import stores
+from phi_crypto import PHICipher, generate_key
+
+# Compares plaintext and PHI-encrypted stores on the same synthetic data:
+# process startup (warm snapshot, and parsing the sources without one),
+# name + DOB lookups through the same kind of index, and the full booking
+# path the conversation runs (schedule, Excel export, reporting
+# ledger, patient record; the confirmation email is left out). Booking rounds
+# alternate between the two stores and the median round is reported, since a
+# single booking varies by more than the overhead being measured. Runs in a
+# temporary directory so the real data/ files are never touched.
+#
+# Usage: python src/benchmark_phi.py [patients]
+
+DOCTORS = ['Dr. Smith', 'Dr. Johnson', 'Dr. Williams', 'Dr. Brown', 'Dr. Davis']
+APPOINTMENTS = 1000
+BOOKING_ROUNDS = 7
+BOOKINGS_PER_ROUND = 10
+
+# Time from interpreter start to a loaded SchedulingServices
+STARTUP_SCRIPT = (
+    "import sys, time; t = time.perf_counter(); "
+    "from services import SchedulingServices; SchedulingServices(sys.argv[1]); "
+    "print(time.perf_counter() - t)"
+)
+
+
+def _synthetic_patients(count):
+    rng = random.Random(42)
+    return pd.DataFrame({
+        'patient_id': [f"P{100000 + i}" for i in range(count)],
+        'first_name': [f"first{i}" for i in range(count)],
+        'last_name': [f"last{rng.randint(0, 5000)}" for _ in range(count)],
+        'dob': [f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(1940, 2005)}" for _ in range(count)],
+        'phone': [f"555-{rng.randint(1000000, 9999999)}" for _ in range(count)],
+        'email': [f"patient{i}@example.com" for i in range(count)],
+        'is_returning': [rng.random() < 0.6 for _ in range(count)],
+        'insurance_carrier': [rng.choice(['Aetna', 'UnitedHealth', 'Cigna', 'BlueCross']) for _ in range(count)],
+        'member_id': [f"M{rng.randint(10000, 99999)}" for _ in range(count)],
+        'group_number': [f"G{rng.randint(100, 999)}" for _ in range(count)],
+    })
+
+
+def _synthetic_schedule(days=60):
+    first = date.today() + timedelta(days=1)
+    times = [f"{hour}:{minute:02d}" for hour in range(9, 17) for minute in (0, 30)]
+    return pd.DataFrame([
+        {'doctor': doctor, 'date': (first + timedelta(days=day)).isoformat(), 'time': time, 'available': True}
+        for doctor in DOCTORS for day in range(days) for time in times
+    ])
+
+
+def _synthetic_appointments(patients, count=APPOINTMENTS):
+    rng = random.Random(7)
+    rows = patients.sample(count, random_state=7)
+    return pd.DataFrame({
+        'Patient Name': (rows['first_name'] + ' ' + rows['last_name']).tolist(),
+        'Patient Type': [rng.choice(['new', 'returning']) for _ in range(count)],
+        'Patient Email': rows['email'].tolist(),
+        'Date of Birth': rows['dob'].tolist(),
+        'Doctor': [rng.choice(DOCTORS) for _ in range(count)],
+        'Appointment Date': [(date.today() - timedelta(days=rng.randint(1, 365))).isoformat() for _ in range(count)],
+        'Appointment Time': ['10:00'] * count,
+        'Duration (min)': [rng.choice([30, 60]) for _ in range(count)],
+        'Insurance Carrier': rows['insurance_carrier'].tolist(),
+        'Member ID': rows['member_id'].tolist(),
+        'Group Number': rows['group_number'].tolist(),
+        'Status': ['Confirmed'] * count,
+        'Booking Timestamp': ['2025-01-01 09:00:00'] * count,
+    })
+
+
+def _set_cipher(cipher):
+    phi_crypto._cipher = cipher
+    phi_crypto._cipher_loaded = True
+
+
+def _use_cipher(cipher):
+    _set_cipher(cipher)
+    stores._process_cache.clear()
+
+
+def _startup_seconds(data_dir, key, snapshot=True, runs=3):
+    env = dict(os.environ, PHI_ENCRYPTION_KEY=key or '',
+               PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    best = None
+    for _ in range(runs):
+        if not snapshot:
+            stores._remove_snapshot(data_dir)
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, data_dir],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        seconds = float(output.strip().splitlines()[-1])
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def _index_lookup_rate(services, patients, cipher, lookups):
+    """Probes of a name + DOB index: the keyed blind index when encrypted,
+    the same normalised key unkeyed when not"""
+    def plain_key(first, last, dob):
+        return f"{str(first).strip().lower()}|{str(last).strip().lower()}|{str(dob).strip()}"
+
+    key = cipher.blind_index if cipher is not None else plain_key
+    db = services.patient_db
+    index = {key(f, l, d) for f, l, d in zip(db['first_name'], db['last_name'], db['dob'])}
+    probes = patients.sample(lookups, replace=True, random_state=1)
+    start = time.perf_counter()
+    for first, last, dob in zip(probes['first_name'], probes['last_name'], probes['dob']):
+        key(first, last, dob) in index
+    return lookups / (time.perf_counter() - start)
+
+
+def _find_patient_rate(services, patients, lookups):
+    """find_patient as the conversation calls it: a substring scan when
+    unencrypted, the blind index when encrypted"""
+    probes = patients.sample(lookups, replace=True, random_state=1)
+    start = time.perf_counter()
+    for first, last, dob in zip(probes['first_name'], probes['last_name'], probes['dob']):
+        services.find_patient(first, last, dob)
+    return lookups / (time.perf_counter() - start)
+
+
+def _book(services, slot, i):
+    from conversation import SessionState
+
+    session = SessionState(
+        clinic='bench', name=f"new{i} patient", dob='01/01/1990', patient_type='new',
+        email=f"new{i}@example.com", doctor=slot['doctor'], date=slot['date'], time=slot['time'],
+        duration=60, carrier='Aetna', member_id=f"M{i}", group_number='G1',
+    )
+    # Same batching as the conversation engine: one batch per event
+    with stores.snapshot_batch():
+        if not services.mark_slots_as_booked(session):
+            raise RuntimeError(f"slot {slot} was not free")
+    with stores.snapshot_batch():
+        services.export_appointment(session)
+        services.add_new_patient(session)
+
+
+def _free_slots(services, count):
+    """count slots whose following half hour is free too, none overlapping"""
+    # New patients take 60 minutes. Slots come earliest first across doctors,
+    # so each doctor needs enough of them for whole hours
+    slots = services.search_slots((count + 1) * 2 * len(DOCTORS))
+    free = {(slot['doctor'], slot['date'], slot['time']) for slot in slots}
+    taken, chosen = set(), []
+    for slot in slots:
+        start = (slot['doctor'], slot['date'], slot['time'])
+        hour, minute = map(int, slot['time'].split(':'))
+        following = (slot['doctor'], slot['date'], f"{hour + (minute + 30) // 60}:{(minute + 30) % 60:02d}")
+        if start in taken or following in taken or following not in free:
+            continue
+        taken.update({start, following})
+        chosen.append(slot)
+    return chosen[:count]
+
+
+def _booking_rates(setups, bookings=BOOKINGS_PER_ROUND, rounds=BOOKING_ROUNDS):
+    """Median bookings / s per setup over rounds that alternate between setups"""
+    rates = {label: [] for label in setups}
+    # The first booking imports the Excel history into the ledger; keep it out of the timing
+    for label, (services, cipher) in setups.items():
+        _set_cipher(cipher)
+        _book(services, _free_slots(services, 1)[0], 0)
+
+    for round_number in range(rounds):
+        for label, (services, cipher) in setups.items():
+            _set_cipher(cipher)
+            slots = _free_slots(services, bookings)
+            start = time.perf_counter()
+            for i, slot in enumerate(slots, 1 + round_number * bookings):
+                _book(services, slot, i)
+            rates[label].append(len(slots) / (time.perf_counter() - start))
+    return {label: statistics.median(values) for label, values in rates.items()}
+
+
+def _run(workdir, patients, key, lookups=2000):
+    from services import SchedulingServices
+
+    cipher = PHICipher(phi_crypto._decode_key(key)) if key else None
+    data_dir = os.path.join(workdir, 'encrypted' if key else 'plaintext')
+    os.makedirs(data_dir)
+    _use_cipher(cipher)
+    stores.save_store('patient_db', patients.copy(), data_dir)
+    stores.save_store('schedule_db', _synthetic_schedule(), data_dir)
+    stores.save_store('all_appointments', _synthetic_appointments(patients), data_dir)
+
+    results = {
+        'parse': _startup_seconds(data_dir, key, snapshot=False),
+        'startup': _startup_seconds(data_dir, key),
+    }
+    _use_cipher(cipher)
+    services = SchedulingServices(data_dir)
+    results['index'] = _index_lookup_rate(services, patients, cipher, lookups)
+    # The scan is slow, so it gets fewer probes
+    results['find'] = _find_patient_rate(services, patients, lookups // 20 if cipher is None else lookups)
+    return results, services, cipher
+
+
+def main(count):
+    patients = _synthetic_patients(count)
+    with tempfile.TemporaryDirectory() as workdir:
+        plain, plain_services, _ = _run(workdir, patients, None)
+        encrypted, encrypted_services, cipher = _run(workdir, patients, generate_key())
+        rates = _booking_rates({'plain': (plain_services, None), 'encrypted': (encrypted_services, cipher)})
+        plain['booking'], encrypted['booking'] = rates['plain'], rates['encrypted']
+
+    def seconds_row(label, key):
+        print(f"{label:<34}{plain[key]:>10.3f}    {encrypted[key]:>10.3f}    {encrypted[key] / plain[key] - 1:>+8.1%}")
+
+    def rate_row(label, key, digits):
+        print(f"{label:<34}{plain[key]:>10.{digits}f}    {encrypted[key]:>10.{digits}f}    {plain[key] / encrypted[key] - 1:>+8.1%}")
+
+    print(f"{count} patients, {APPOINTMENTS} appointments")
+    print(f"{'':<34} plaintext     encrypted    overhead")
+    seconds_row("startup, warm snapshot (s)", 'startup')
+    seconds_row("startup, parsing sources (s)", 'parse')
+    rate_row("lookups / s, name + DOB index", 'index', 0)
+    rate_row(f"bookings / s, median of {BOOKING_ROUNDS} rounds", 'booking', 2)
+    print(f"\nfind_patient / s: {plain['find']:.0f} unencrypted (substring scan), "
+          f"{encrypted['find']:.0f} encrypted (blind index)")
+    # The warm snapshot exists so that startup costs a fraction of a parse
+    print(f"Warm start as a share of a plaintext parse: plaintext {plain['startup'] / plain['parse']:.0%}, "
+          f"encrypted {encrypted['startup'] / plain['parse']:.0%}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,137 @@
+import os
+import csv
+import math
+import heapq
+import threading
+from datetime import date
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from services import SchedulingServices, WORKERS
+from stores import DATA_DIR
+
+# Each clinic is a shard with its own schedule, patient and appointment
+# stores under data/clinics/<clinic_id>/, and its own write lock. Clinics are
+# listed in data/clinics.csv (clinic_id, name, latitude, longitude); without
+# that file the single-clinic layout directly under data/ is used.
+CLINICS_PATH = 'data/clinics.csv'
+CLINICS_DIR = 'data/clinics'
+DEFAULT_CLINIC = 'main'
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def distance_miles(lat1, lon1, lat2, lon2):
+    """Great-circle (haversine) distance between two points"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+def _coordinate(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_registry(path=CLINICS_PATH):
+    """clinic_id -> {name, latitude, longitude, data_dir}"""
+    default = {DEFAULT_CLINIC: {'name': 'Medical Clinic', 'latitude': None, 'longitude': None, 'data_dir': DATA_DIR}}
+    if not os.path.exists(path):
+        return default
+
+    registry = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            clinic_id = row['clinic_id'].strip()
+            registry[clinic_id] = {
+                'name': row.get('name') or clinic_id,
+                'latitude': _coordinate(row.get('latitude')),
+                'longitude': _coordinate(row.get('longitude')),
+                'data_dir': os.path.join(CLINICS_DIR, clinic_id),
+            }
+    if not registry:
+        print(f"⚠️ No clinics listed in {path}; using the single-clinic layout in {DATA_DIR}")
+        return default
+    return registry
+
+
+class ClinicRouter:
+    """Routes conversations and queries to per-clinic store shards"""
+    def __init__(self, registry=None, max_workers=8):
+        self.registry = registry or load_registry()
+        self.default_clinic = next(iter(self.registry))
+        self._shards = {}
+        self._shards_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='clinic-shard')
+
+    def shard(self, clinic_id=None):
+        """Services for one clinic, loaded on first use"""
+        clinic_id = clinic_id or self.default_clinic
+        if clinic_id not in self.registry:
+            raise KeyError(f"Unknown clinic: {clinic_id}")
+        shard = self._shards.get(clinic_id)
+        if shard is None:
+            with self._shards_lock:
+                shard = self._shards.get(clinic_id)
+                if shard is None:
+                    shard = SchedulingServices(self.registry[clinic_id]['data_dir'])
+                    self._shards[clinic_id] = shard
+        return shard
+
+    def subscribe_workers(self, events):
+        """Attach workers that run against the session's own clinic"""
+        for event, worker in WORKERS:
+            events.subscribe(event, self._routed(worker))
+
+    def _routed(self, worker):
+        def routed(session):
+            return getattr(self.shard(session.clinic), worker)(session)
+        routed.__name__ = worker
+        return routed
+
+    def clinics_near(self, latitude=None, longitude=None, radius_miles=None):
+        """Clinic ids within radius_miles of a point (all clinics when no point is given)"""
+        if latitude is None or longitude is None or radius_miles is None:
+            return list(self.registry)
+        nearby = []
+        for clinic_id, clinic in self.registry.items():
+            if clinic['latitude'] is None or clinic['longitude'] is None:
+                continue
+            if distance_miles(latitude, longitude, clinic['latitude'], clinic['longitude']) <= radius_miles:
+                nearby.append(clinic_id)
+        return nearby
+
+    def earliest_slots(self, limit=10, latitude=None, longitude=None, radius_miles=None, **preferences):
+        """Top-ranked free slots across clinics, e.g. any clinic within 20 miles.
+
+        Each shard ranks its own slots in parallel on the pool (see
+        SchedulingServices.search_slots for the preferences); the per-clinic
+        top lists are then combined with a k-way heap merge on score.
+        """
+        # Every shard searches from the same day
+        preferences.setdefault('start_date', date.today().isoformat())
+        clinic_ids = self.clinics_near(latitude, longitude, radius_miles)
+        futures = [self._pool.submit(self._clinic_slots, clinic_id, limit, preferences) for clinic_id in clinic_ids]
+        merged = heapq.merge(*(future.result() for future in futures), key=lambda slot: slot['score'])
+        return list(islice(merged, limit))
+
+    def _clinic_slots(self, clinic_id, limit, preferences):
+        slots = self.shard(clinic_id).search_slots(limit, **preferences)
+        for slot in slots:
+            slot['clinic'] = clinic_id
+        return slots
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Process-wide router shared by every conversation"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ClinicRouter()
+    return _router
@@ -0,0 +1,308 @@
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, fields
+
+from clinics import get_router
+from stores import StoreUnavailableError, snapshot_batch
+
+CANCEL_WORDS = {'cancel', 'exit', 'quit', 'stop', 'restart'}
+
+RECORDS_UNAVAILABLE = "⚠️ Patient records at this clinic are unavailable right now. Please try again later, or type 'cancel' to stop."
+
+# Declarative transition table: (current step, event) -> next step.
+# '*' matches any step. Events without an entry leave the step unchanged
+# (e.g. 'invalid' re-prompts for the same input, 'slot_taken' re-shows the
+# calendar when another session booked the slot first, 'save_failed' retries
+# the confirmation on the next message).
+TRANSITIONS = {
+    ('get_name', 'name_received'): 'get_dob',
+    ('get_dob', 'patient_identified'): 'show_calendar',
+    ('get_dob', 'no_slots'): 'get_name',
+    ('show_calendar', 'slot_selected'): 'get_insurance',
+    ('get_insurance', 'insurance_received'): 'get_email',
+    ('get_email', 'email_received'): 'confirm',
+    ('confirm', 'confirmed'): 'get_name',
+    ('*', 'cancelled'): 'get_name',
+}
+
+# Step -> handler method consuming the user's message
+HANDLERS = {
+    'get_name': '_on_name',
+    'get_dob': '_on_dob',
+    'show_calendar': '_on_show_calendar',
+    'get_insurance': '_on_insurance',
+    'get_email': '_on_email',
+    'confirm': '_on_confirm',
+}
+
+# Steps that run as soon as they are entered, without waiting for input
+AUTO_STEPS = {'confirm'}
+
+
+@dataclass(slots=True)
+class SessionState:
+    """Per-conversation state; everything else is shared between sessions"""
+    clinic: str = None
+    step: str = "get_name"
+    name: str = None
+    dob: str = None
+    patient_type: str = None
+    email: str = None
+    doctor: str = None
+    date: str = None
+    time: str = None
+    duration: int = None
+    carrier: str = None
+    member_id: str = None
+    group_number: str = None
+
+    def reset(self):
+        # The clinic is chosen when the session starts and survives a restart
+        for f in fields(self):
+            if f.name != 'clinic':
+                setattr(self, f.name, f.default)
+
+
+class EventBus:
+    """Dispatches conversation events to side-effect workers"""
+    def __init__(self):
+        self._workers = defaultdict(list)
+
+    def subscribe(self, event, worker):
+        self._workers[event].append(worker)
+
+    def emit(self, event, session):
+        """Run every worker for the event; returns {worker name: result}"""
+        results = {}
+        for worker in self._workers.get(event, ()):
+            try:
+                results[worker.__name__] = worker(session)
+            except Exception as e:
+                print(f"❌ Worker {worker.__name__} failed on {event}: {e}")
+                results[worker.__name__] = False
+        return results
+
+
+class ConversationEngine:
+    """Table-driven booking conversation over shared, clinic-sharded services"""
+    def __init__(self, clinics):
+        self.clinics = clinics
+        self.events = EventBus()
+        clinics.subscribe_workers(self.events)
+
+    def services(self, session):
+        """Services of the clinic this session is booking at"""
+        return self.clinics.shard(session.clinic)
+
+    def process_message(self, session: SessionState, user_input: str):
+        print(f"Processing: {user_input}, Step: {session.step}")
+
+        # Check for cancellation at any step
+        if user_input.lower() in CANCEL_WORDS:
+            return self._transition(session, 'cancelled', "❌ Appointment cancelled. How can I help you today? Type your name to start a new booking.")
+
+        handler = HANDLERS.get(session.step)
+        if handler is None:
+            return "I'm not sure what to do next. Please start over."
+        try:
+            event, response = getattr(self, handler)(session, user_input)
+        except StoreUnavailableError as e:
+            # The session stays at its step, so the next message retries
+            print(f"❌ {e}")
+            return RECORDS_UNAVAILABLE
+        return self._transition(session, event, response)
+
+    def select_slot(self, session: SessionState, selected_slot_info):
+        if session.step != 'show_calendar':
+            return "Invalid slot selection. Please try again."
+        # 'clinic|doctor|date|time' picks a slot at another clinic, e.g. from
+        # an earliest-slot search across nearby clinics
+        parts = selected_slot_info.split('|')
+        clinic = session.clinic
+        if len(parts) == 4 and parts[0] in self.clinics.registry:
+            clinic = parts.pop(0)
+        try:
+            doctor, date, time = parts
+        except ValueError:
+            return "Invalid slot selection. Please try again."
+
+        # Patient records are kept per clinic, so someone returning at one
+        # clinic may be new at another
+        try:
+            services = self.clinics.shard(clinic)
+            patient_type = session.patient_type
+            if clinic != session.clinic:
+                patient_type = "returning" if self._is_returning(services, session) else "new"
+        except StoreUnavailableError as e:
+            print(f"❌ {e}")
+            return RECORDS_UNAVAILABLE
+
+        # Determine appointment duration based on patient type
+        duration = 60 if patient_type == 'new' else 30
+        session.doctor, session.date, session.time, session.duration = doctor, date, time, duration
+
+        # Sessions share the schedule, so the slot is checked and booked in one
+        # call; the session only moves to the slot's clinic once it is ours
+        if not services.mark_slots_as_booked(session):
+            session.doctor = session.date = session.time = session.duration = None
+            return self._transition(session, 'slot_taken', {"message": "Sorry, that time slot is no longer available. Please select another time slot from the calendar.", "show_calendar": True})
+        session.clinic, session.patient_type = clinic, patient_type
+        duration_msg = "60 minutes" if duration == 60 else "30 minutes"
+        return self._transition(session, 'slot_selected', f"As a {session.patient_type} patient, your appointment will be {duration_msg}. Now let's collect your insurance information. Please provide:\n1. Insurance Carrier (e.g., Aetna, BlueCross)\n2. Member ID\n3. Group Number (if available)\n\nType 'cancel' to stop the booking process.")
+
+    def _transition(self, session, event, response):
+        """Emit the event, then move the session along the transition table"""
+        # All store writes of the event and of any step it runs share one
+        # snapshot rewrite
+        with snapshot_batch():
+            self.events.emit(event, session)
+            next_step = TRANSITIONS.get((session.step, event)) or TRANSITIONS.get(('*', event))
+            if next_step is None:
+                return response
+
+            if next_step == 'get_name':
+                session.reset()
+            session.step = next_step
+
+            if next_step in AUTO_STEPS:
+                event, response = getattr(self, HANDLERS[next_step])(session, '')
+                return self._transition(session, event, response)
+            return response
+
+    def _on_name(self, session, user_input):
+        if user_input.strip():
+            session.name = user_input.strip()
+            return 'name_received', f"Nice to meet you, {session.name}! What is your date of birth? (MM/DD/YYYY)\n\nYou can type 'cancel' at any time to stop the booking process."
+        return 'invalid', "Please provide your full name. Type 'cancel' to stop."
+
+    def _on_dob(self, session, user_input):
+        # Validate DOB format (MM/DD/YYYY or MM-DD-YYYY)
+        dob_pattern = r'^(0[1-9]|1[0-2])[/-](0[1-9]|[12][0-9]|3[01])[/-]\d{4}$'
+
+        if not re.match(dob_pattern, user_input.strip()):
+            return 'invalid', "Please provide your date of birth in MM/DD/YYYY format (e.g., 01/15/1990). Type 'cancel' to stop the booking process."
+
+        # Convert to standard format MM/DD/YYYY
+        session.dob = user_input.strip().replace('-', '/')
+
+        # Check if patient exists with same name AND dob
+        if self._is_returning(self.services(session), session):
+            session.patient_type = "returning"
+            response = f"Welcome back {session.name}! I found you in our system as a returning patient."
+        else:
+            session.patient_type = "new"
+            response = f"Nice to meet you {session.name}! I'll set you up as a new patient."
+
+        if self.services(session).has_available_slots():
+            # Return both message and calendar trigger
+            return 'patient_identified', {"message": response + " Please select an available time slot from the calendar.", "show_calendar": True}
+        return 'no_slots', response + " Unfortunately, there are no available slots at the moment. Please try again later."
+
+    def _is_returning(self, services, session):
+        """Whether a patient with the session's name and DOB is on file at the clinic"""
+        name_parts = session.name.split()
+        return len(name_parts) >= 2 and services.find_patient(name_parts[0], name_parts[1], session.dob)
+
+    def _on_show_calendar(self, session, user_input):
+        # Return both the message and trigger calendar UI
+        return 'invalid', {"message": "Please select an available time slot from the calendar.", "show_calendar": True}
+
+    def _on_insurance(self, session, user_input):
+        user_input_lower = user_input.lower()
+
+        # Extract insurance information using patterns
+        insurance_carriers = ['aetna', 'bluecross', 'blue cross', 'united', 'cigna']
+        for carrier in insurance_carriers:
+            if carrier in user_input_lower:
+                session.carrier = carrier.title().replace(' ', '')
+                break
+
+        # Extract member ID (pattern like M12345, ID: 12345, etc.)
+        member_id_pattern = r'(?:member\s*id|id|member)\s*[:#]?\s*([A-Z0-9-]+)'
+        member_match = re.search(member_id_pattern, user_input, re.IGNORECASE)
+        if member_match:
+            session.member_id = member_match.group(1)
+
+        # Extract group number
+        group_pattern = r'(?:group\s*number|group)\s*[:#]?\s*([A-Z0-9-]+)'
+        group_match = re.search(group_pattern, user_input, re.IGNORECASE)
+        if group_match:
+            session.group_number = group_match.group(1)
+
+        # Ask for missing information
+        if session.carrier is None or session.member_id is None:
+            missing = []
+            if session.carrier is None:
+                missing.append("insurance carrier")
+            if session.member_id is None:
+                missing.append("member ID")
+            return 'invalid', f"I still need your {', '.join(missing)}. Please provide the missing information. Type 'cancel' to stop."
+
+        summary = f"Insurance information received:\n- Carrier: {session.carrier}\n- Member ID: {session.member_id}"
+        if session.group_number is not None:
+            summary += f"\n- Group Number: {session.group_number}"
+
+        # Add duration information
+        duration = session.duration or 30
+        duration_msg = "60 minutes (new patient)" if duration == 60 else "30 minutes (returning patient)"
+        summary += f"\n\nAppointment Duration: {duration_msg}"
+        summary += "\n\nWhat is your email address for confirmation and patient forms? Type 'cancel' to stop."
+        return 'insurance_received', summary
+
+    def _on_email(self, session, user_input):
+        email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
+        email_match = re.search(email_pattern, user_input)
+
+        if email_match:
+            session.email = email_match.group(0)
+            return 'email_received', None
+        return 'invalid', "Please provide a valid email address. Type 'cancel' to stop the booking process."
+
+    def _on_confirm(self, session, user_input):
+        # Generate confirmation message with duration info
+        duration = session.duration or 30
+        duration_msg = "60 minutes (new patient)" if duration == 60 else "30 minutes (returning patient)"
+
+        confirmation_msg = f"""
+        ✅ Appointment Confirmed!
+
+        Patient: {session.name or 'N/A'} ({session.patient_type or 'new'})
+        Email: {session.email or 'N/A'}
+        Doctor: {session.doctor or 'N/A'}
+        Date: {session.date or 'N/A'}
+        Time: {session.time or 'N/A'}
+        Duration: {duration_msg}
+
+        Insurance Information:
+        - Carrier: {session.carrier or 'Not provided'}
+        - Member ID: {session.member_id or 'Not provided'}
+        - Group Number: {session.group_number or 'Not provided'}
+        """
+
+        # The appointment is confirmed only once it is saved; patient
+        # registration then runs as a 'confirmed' worker
+        services = self.services(session)
+        if not services.export_appointment(session):
+            return 'save_failed', "⚠️ There was an issue saving your appointment. Reply to try again, or type 'cancel' to stop."
+
+        if services.send_confirmation_email(session):
+            confirmation_msg += "\n\n📧 Confirmation email with patient intake form has been sent to your email address!"
+        else:
+            confirmation_msg += "\n\n✅ Appointment saved. Email could not be sent."
+
+        # Reset for next conversation but keep the confirmation message
+        return 'confirmed', confirmation_msg + "\n\n💬 How can I help you today? Type your name to start a new booking."
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Process-wide engine shared by every conversation"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ConversationEngine(get_router())
+    return _engine
@@ -0,0 +1,350 @@
+import os
+import sys
+import json
+import base64
+import pickle
+import struct
+import hashlib
+import hmac
+import threading
+
+# Encryption at rest for patient identifiers. PHI columns are removed from
+# the CSV/Excel stores and written to a '<store>.phi' sidecar as AES-GCM
+# sealed column chunks of CHUNK_ROWS values each, so a whole page is one
+# cipher call instead of one per cell. The sidecar is a JSON header line
+# followed by one length-prefixed binary record per (chunk, column), ordered
+# chunk by chunk so it can be re-encrypted as a stream. Chunk payloads are
+# pickled lists; GCM authentication means only key holders can produce one.
+#
+# The header records a digest of the store file the sidecar was written
+# with. A sidecar is first written to '<store>.phi.pending' and only moved
+# into place after the store file, so a write interrupted in between is
+# completed on the next read; any other mismatch is refused rather than
+# attaching identifiers to the wrong rows.
+#
+# Encryption is enabled by setting PHI_ENCRYPTION_KEY to a urlsafe base64
+# encoded 32 byte key. Without it the stores stay plaintext as before. Stores
+# written before the key was set are sealed by the 'encrypt' command, or on
+# their first load with the key.
+
+CHUNK_ROWS = 4096
+SIDECAR_SUFFIX = '.phi'
+PENDING_SUFFIX = '.pending'
+BLIND_INDEX_COLUMN = 'blind_index'
+# column position in the header, chunk number, sealed blob length
+RECORD_HEADER = struct.Struct('<HII')
+
+PHI_COLUMNS = {
+    'patient_db': ['first_name', 'last_name', 'dob', 'phone', 'email', 'member_id', 'group_number'],
+    'all_appointments': ['Patient Name', 'Patient Email', 'Date of Birth', 'Member ID', 'Group Number'],
+}
+
+
+class SidecarMismatchError(ValueError):
+    """A sidecar that was not written together with its store file"""
+
+
+def generate_key():
+    return base64.urlsafe_b64encode(os.urandom(32)).decode()
+
+
+def _decode_key(encoded):
+    key = base64.urlsafe_b64decode(encoded)
+    if len(key) != 32:
+        raise ValueError("PHI encryption key must be 32 bytes (urlsafe base64 encoded)")
+    return key
+
+
+class PHICipher:
+    def __init__(self, key: bytes):
+        # Imported here so the dependency is only needed when encryption is on
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+        from cryptography.hazmat.primitives import hashes
+
+        self._aead = AESGCM(key)
+        self.key_id = hashlib.sha256(key).hexdigest()[:16]
+        # Separate subkey for blind indexes so they reveal nothing about the data key
+        index_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'phi-blind-index').derive(key)
+        # Keyed once; each index copies it instead of redoing the key schedule
+        self._index_mac = hmac.new(index_key, digestmod=hashlib.sha256)
+
+    def seal(self, data: bytes, aad: bytes) -> bytes:
+        nonce = os.urandom(12)
+        return nonce + self._aead.encrypt(nonce, data, aad)
+
+    def open(self, blob, aad: bytes) -> bytes:
+        # A view avoids copying large blobs (e.g. a memory-mapped snapshot)
+        with memoryview(blob) as view:
+            return self._aead.decrypt(view[:12], view[12:], aad)
+
+    def blind_index(self, first_name, last_name, dob):
+        """Keyed hash of name + DOB, used to look patients up without decrypting"""
+        token = f"{str(first_name).strip().lower()}|{str(last_name).strip().lower()}|{str(dob).strip()}"
+        # 128 bits is ample for equality lookups and keeps the column compact
+        mac = self._index_mac.copy()
+        mac.update(token.encode())
+        return mac.hexdigest()[:32]
+
+
+_cipher = None
+_cipher_loaded = False
+
+
+def get_cipher():
+    """Cipher for the configured key, or None when encryption is disabled"""
+    global _cipher, _cipher_loaded
+    if not _cipher_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        encoded = os.getenv("PHI_ENCRYPTION_KEY")
+        _cipher = PHICipher(_decode_key(encoded)) if encoded else None
+        _cipher_loaded = True
+    return _cipher
+
+
+def sidecar_path(path):
+    return path + SIDECAR_SUFFIX
+
+
+def pending_path(path):
+    return sidecar_path(path) + PENDING_SUFFIX
+
+
+def source_digest(data: bytes):
+    """Digest of a store file's bytes, recorded in its sidecar header"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def commit_sidecar(path):
+    """Move the pending sidecar into place, once the store file it matches is"""
+    os.replace(pending_path(path), sidecar_path(path))
+
+
+def _read_header(sidecar):
+    with open(sidecar, 'rb') as f:
+        return json.loads(f.readline())
+
+
+def _header_source(sidecar, default=None):
+    """Store file digest a sidecar was written with; None when there is no sidecar"""
+    if not os.path.exists(sidecar):
+        return None
+    return _read_header(sidecar).get('source', default)
+
+
+def _aad(path, column, chunk):
+    return f"{os.path.basename(path)}|{column}|{chunk}".encode()
+
+
+# (path, column, chunk) -> (key id, payload digest, blob) from the last write,
+# so appends only re-encrypt the chunks that actually changed. Only a digest
+# of each chunk is kept, never its plaintext values.
+_sealed_chunks = {}
+
+
+def _records(path, cipher, chunk_columns, reuse=True):
+    """Sealed (column, chunk, blob) records, chunk by chunk"""
+    for chunk, values_by_column in chunk_columns:
+        for column, values in values_by_column:
+            payload = pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL)
+            if not reuse:
+                yield column, chunk, cipher.seal(payload, _aad(path, column, chunk))
+                continue
+            digest = hashlib.blake2b(payload, digest_size=16).digest()
+            cached = _sealed_chunks.get((path, column, chunk))
+            if cached is not None and cached[0] == cipher.key_id and cached[1] == digest:
+                blob = cached[2]
+            else:
+                blob = cipher.seal(payload, _aad(path, column, chunk))
+                _sealed_chunks[(path, column, chunk)] = (cipher.key_id, digest, blob)
+            yield column, chunk, blob
+
+
+def _write_sidecar(path, header, records):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    positions = {column: i for i, column in enumerate(header['columns'])}
+    with open(tmp_path, 'wb') as f:
+        f.write(json.dumps(header).encode() + b'\n')
+        for column, chunk, blob in records:
+            f.write(RECORD_HEADER.pack(positions[column], chunk, len(blob)))
+            f.write(blob)
+    os.replace(tmp_path, path)
+
+
+def _column_values(series):
+    """Plain Python values of a column, with missing values as None"""
+    if series.hasnans:
+        series = series.astype(object).where(series.notna(), None)
+    return series.tolist()
+
+
+def seal_columns(frame, columns, path, cipher, source):
+    """Write the PHI columns of frame to path's pending sidecar.
+
+    source is the digest of the store file being written alongside; call
+    commit_sidecar() once that file is in place.
+    """
+    columns = [c for c in columns if c in frame.columns]
+    rows = len(frame)
+    header = {
+        'version': 2,
+        'key_id': cipher.key_id,
+        'source': source,
+        'rows': rows,
+        'chunk_rows': CHUNK_ROWS,
+        'columns': columns,
+        'order': list(frame.columns),
+    }
+    data = {column: _column_values(frame[column]) for column in columns}
+    chunk_columns = (
+        (chunk, [(column, data[column][start:start + CHUNK_ROWS]) for column in columns])
+        for chunk, start in enumerate(range(0, rows, CHUNK_ROWS))
+    )
+    _write_sidecar(pending_path(path), header, _records(path, cipher, chunk_columns))
+
+
+def _read_sidecar(path, cipher, decrypt=None):
+    """Header, then (column, chunk, values) records; columns not in decrypt are skipped"""
+    with open(sidecar_path(path), 'rb') as f:
+        header = json.loads(f.readline())
+        if header['key_id'] != cipher.key_id:
+            raise ValueError(f"{sidecar_path(path)} was encrypted with a different key ({header['key_id']})")
+        yield header
+        while True:
+            record_header = f.read(RECORD_HEADER.size)
+            if not record_header:
+                break
+            position, chunk, length = RECORD_HEADER.unpack(record_header)
+            column = header['columns'][position]
+            if decrypt is not None and column not in decrypt:
+                f.seek(length, os.SEEK_CUR)
+                continue
+            payload = cipher.open(f.read(length), _aad(path, column, chunk))
+            yield column, chunk, pickle.loads(payload)
+
+
+def open_columns(frame, path, cipher, source=None):
+    """Re-attach the decrypted PHI columns from path's sidecar, if there is one.
+
+    source is the digest of the store file frame was parsed from. Raises
+    SidecarMismatchError when the sidecar was written with another version
+    of the file.
+    """
+    sidecar = sidecar_path(path)
+    # Version 1 sidecars have no digest; only their row count is checked
+    if source is not None and _header_source(sidecar, source) != source:
+        if _header_source(pending_path(path)) == source:
+            # The last write replaced the store file but stopped before its sidecar
+            commit_sidecar(path)
+            print(f"🔧 Completed the interrupted write of {sidecar}")
+        elif os.path.exists(sidecar):
+            raise SidecarMismatchError(f"{sidecar} was not written with the current {path}")
+    if not os.path.exists(sidecar):
+        return frame
+
+    records = _read_sidecar(path, cipher)
+    header = next(records)
+    if header['rows'] != len(frame):
+        raise SidecarMismatchError(f"{sidecar} has {header['rows']} rows but {path} has {len(frame)}")
+
+    values = {column: [None] * header['rows'] for column in header['columns']}
+    for column, chunk, chunk_values in records:
+        start = chunk * header['chunk_rows']
+        values[column][start:start + len(chunk_values)] = chunk_values
+
+    frame = frame.copy()
+    for column, column_values in values.items():
+        frame[column] = column_values
+    order = [c for c in header['order'] if c in frame.columns]
+    return frame[order + [c for c in frame.columns if c not in order]]
+
+
+INDEX_COLUMNS = ['first_name', 'last_name', 'dob']
+
+
+def rotated_blind_indexes(path, old_cipher, new_cipher):
+    """Blind indexes (row order) under new_cipher, when path's sidecar holds
+    patient names and DOBs; None otherwise. Only those columns are decrypted.
+    """
+    records = _read_sidecar(path, old_cipher, decrypt=INDEX_COLUMNS)
+    header = next(records)
+    if not all(c in header['columns'] for c in INDEX_COLUMNS):
+        return None
+    blind_indexes, pending, current = [], {}, None
+
+    def flush():
+        blind_indexes.extend(new_cipher.blind_index(f, l, d) for f, l, d in zip(*(pending[c] for c in INDEX_COLUMNS)))
+
+    for column, chunk, values in records:
+        if chunk != current and pending:
+            flush()
+            pending = {}
+        current = chunk
+        pending[column] = values
+    if pending:
+        flush()
+    return blind_indexes
+
+
+def rotate_key(path, old_cipher, new_cipher, source):
+    """Stream path's sidecar through re-encryption under new_cipher.
+
+    Writes the pending sidecar for the store file with digest source; call
+    commit_sidecar() once that file is in place.
+    """
+    records = _read_sidecar(path, old_cipher)
+    header = next(records)
+    header.update(version=2, key_id=new_cipher.key_id, source=source)
+
+    def rekeyed():
+        # Records arrive chunk by chunk, so only one chunk is held at a time
+        pending, current = {}, None
+        for column, chunk, values in records:
+            if chunk != current:
+                if pending:
+                    yield from flush(current, pending)
+                pending, current = {}, chunk
+            pending[column] = values
+        if pending:
+            yield from flush(current, pending)
+
+    def flush(chunk, pending):
+        # Not cached, so rotation never holds more than the current chunk
+        yield from _records(path, new_cipher, [(chunk, list(pending.items()))], reuse=False)
+
+    _write_sidecar(pending_path(path), header, rekeyed())
+    for key in [key for key in _sealed_chunks if key[0] == path]:
+        del _sealed_chunks[key]
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'genkey':
+        print(generate_key())
+    elif len(sys.argv) > 1 and sys.argv[1] == 'encrypt':
+        # Usage (after setting PHI_ENCRYPTION_KEY): python src/phi_crypto.py encrypt
+        from clinics import load_registry
+        from stores import encrypt_stores
+
+        cipher = get_cipher()
+        if cipher is None:
+            sys.exit("PHI_ENCRYPTION_KEY is not set")
+        for clinic in load_registry().values():
+            encrypt_stores(cipher, clinic['data_dir'])
+        print(f"✅ PHI stores are encrypted under key {cipher.key_id}")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'rotate':
+        # Usage (with the app stopped): PHI_NEW_ENCRYPTION_KEY=... python src/phi_crypto.py rotate
+        from clinics import load_registry
+        from stores import rotate_store_keys
+
+        old_cipher = get_cipher()
+        if old_cipher is None:
+            sys.exit("PHI_ENCRYPTION_KEY is not set")
+        if not os.getenv("PHI_NEW_ENCRYPTION_KEY"):
+            sys.exit("PHI_NEW_ENCRYPTION_KEY is not set")
+        new_cipher = PHICipher(_decode_key(os.environ["PHI_NEW_ENCRYPTION_KEY"]))
+        for clinic in load_registry().values():
+            rotate_store_keys(old_cipher, new_cipher, clinic['data_dir'])
+        print(f"✅ Re-encrypted PHI stores under key {new_cipher.key_id}. Update PHI_ENCRYPTION_KEY.")
+    else:
+        print("Usage: python src/phi_crypto.py [genkey|encrypt|rotate]")
@@ -0,0 +1,460 @@
+import os
+import glob
+from datetime import datetime
+
+import pandas as pd
+
+# Columnar ledger: one Parquet partition per appointment date, plus small
+# materialised tables of daily aggregates and slot capacity that dashboards
+# read directly. Those are partitioned by month, so a booking rewrites only
+# its own month.
+LEDGER_DIR = 'data/ledger'
+DAILY_AGGREGATES_DIR = 'data/ledger_daily'
+CAPACITY_DIR = 'data/ledger_capacity'
+SCHEDULE_PATH = 'data/doctor_schedules.csv'
+EXCEL_LEDGER_PATH = 'data/all_appointments.xlsx'
+# Written into the ledger directory once the Excel history has been imported
+IMPORT_MARKER = '_excel_imported'
+
+# Only the columns needed for reporting are kept in the columnar ledger.
+# Patient identifiers (name, DOB, email, member/group IDs) stay in the
+# operational Excel export.
+LEDGER_COLUMNS = {
+    'Appointment Date': 'appointment_date',
+    'Appointment Time': 'appointment_time',
+    'Doctor': 'doctor',
+    'Patient Type': 'patient_type',
+    'Duration (min)': 'duration_min',
+    'Insurance Carrier': 'insurance_carrier',
+    'Status': 'status',
+    'Booking Timestamp': 'booked_at',
+}
+
+# Dimensions of the daily aggregate table; every report is a group-by over
+# a subset of these keys.
+AGGREGATE_KEYS = ['appointment_date', 'doctor', 'patient_type', 'duration_min', 'insurance_carrier', 'status']
+CAPACITY_KEYS = ['appointment_date', 'doctor']
+CAPACITY_COLUMNS = CAPACITY_KEYS + ['total_slots', 'booked_slots']
+AGGREGATE_COLUMNS = AGGREGATE_KEYS + ['appointments', 'booked_minutes']
+
+
+def _normalise_ledger(appointments: pd.DataFrame) -> pd.DataFrame:
+    """Map Excel-style appointment records onto the columnar ledger schema"""
+    df = appointments.copy()
+    # Older exports used a plain 'Duration' column before 'Duration (min)'
+    if 'Duration' in df.columns:
+        if 'Duration (min)' in df.columns:
+            df['Duration (min)'] = df['Duration (min)'].fillna(df['Duration'])
+        else:
+            df['Duration (min)'] = df['Duration']
+    for column in LEDGER_COLUMNS:
+        if column not in df.columns:
+            df[column] = None
+    df = df[list(LEDGER_COLUMNS)].rename(columns=LEDGER_COLUMNS)
+
+    df['appointment_date'] = df['appointment_date'].astype(str)
+    df['appointment_time'] = df['appointment_time'].astype(str)
+    df['doctor'] = df['doctor'].fillna('Unknown').astype(str)
+    df['duration_min'] = pd.to_numeric(df['duration_min'], errors='coerce').fillna(30).astype('int64')
+    # Rows without a recorded patient type predate that column; infer it
+    # from the duration rule (60 min new, 30 min returning)
+    inferred_type = df['duration_min'].map(lambda d: 'new' if d >= 60 else 'returning')
+    df['patient_type'] = df['patient_type'].fillna(inferred_type).astype(str)
+    df['insurance_carrier'] = df['insurance_carrier'].fillna('None').astype(str)
+    df['status'] = df['status'].fillna('Confirmed').astype(str)
+    df['booked_at'] = df['booked_at'].astype(str)
+    return df
+
+
+def _schedule_capacity(schedule: pd.DataFrame) -> pd.DataFrame:
+    """Total and booked slots per (date, doctor) of a schedule frame"""
+    schedule = schedule[['doctor', 'date', 'available']].assign(
+        appointment_date=schedule['date'].astype(str),
+        booked=~schedule['available'].astype(bool),
+    )
+    return (
+        schedule.groupby(CAPACITY_KEYS)
+        .agg(total_slots=('available', 'size'), booked_slots=('booked', 'sum'))
+        .reset_index()
+    )
+
+
+def _month(appointment_date):
+    """Partition of a date, e.g. '2025-09' for '2025-09-05'"""
+    return str(appointment_date)[:7]
+
+
+class _MonthlyTable:
+    """A materialised table stored as one Parquet file per month.
+    
+    Partitions are cached with their mtimes, so reads only reload the
+    months another process has rewritten.
+    """
+    def __init__(self, directory, columns, sort_keys):
+        self.directory = directory
+        self.columns = columns
+        self.sort_keys = sort_keys
+        self._partitions = {}
+        self._combined = None
+    
+    def _path(self, month):
+        return os.path.join(self.directory, f"month={month}.parquet")
+    
+    def _mtimes(self):
+        mtimes = {}
+        for path in glob.glob(os.path.join(self.directory, 'month=*.parquet')):
+            month = os.path.basename(path)[len('month='):-len('.parquet')]
+            try:
+                mtimes[month] = os.path.getmtime(path)
+            except OSError:
+                pass
+        return mtimes
+    
+    def exists(self):
+        return bool(self._mtimes())
+    
+    def newest_mtime(self):
+        return max(self._mtimes().values(), default=None)
+    
+    def read_month(self, month):
+        path = self._path(month)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=self.columns)
+        mtime = os.path.getmtime(path)
+        cached = self._partitions.get(month)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, pd.read_parquet(path))
+            self._partitions[month] = cached
+            self._combined = None
+        return cached[1]
+    
+    def read(self):
+        """The whole table, months in order"""
+        mtimes = self._mtimes()
+        for month in set(self._partitions) - set(mtimes):
+            del self._partitions[month]
+            self._combined = None
+        frames = [self.read_month(month) for month in sorted(mtimes)]
+        if self._combined is None:
+            frames = [frame for frame in frames if not frame.empty]
+            self._combined = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=self.columns)
+        return self._combined
+    
+    def write_month(self, month, frame):
+        """Replace one month's partition (removed when frame is empty)"""
+        path = self._path(month)
+        self._combined = None
+        if frame.empty:
+            self._partitions.pop(month, None)
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        frame = frame.sort_values(self.sort_keys, ignore_index=True)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = path + '.tmp'
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        self._partitions[month] = (os.path.getmtime(path), frame)
+    
+    def replace_dates(self, fresh, dates):
+        """Swap in fresh rows for the given dates, rewriting only their months"""
+        dates = {str(d) for d in dates}
+        for month in sorted({_month(d) for d in dates}):
+            existing = self.read_month(month)
+            existing = existing[~existing['appointment_date'].isin(dates)]
+            rows = fresh[fresh['appointment_date'].map(_month) == month]
+            parts = [frame for frame in (existing, rows) if not frame.empty]
+            self.write_month(month, pd.concat(parts, ignore_index=True) if parts else existing)
+    
+    def replace_all(self, fresh):
+        """Rebuild every month from fresh, dropping months it no longer has"""
+        months = fresh['appointment_date'].map(_month)
+        for month in set(self._mtimes()) - set(months):
+            self.write_month(month, pd.DataFrame(columns=self.columns))
+        if not fresh.empty:
+            for month, rows in fresh.groupby(months):
+                self.write_month(month, rows)
+
+
+class ReportQueries:
+    """Reports over daily aggregate and slot capacity tables.
+    
+    Built from functions returning the current tables, so the same reports
+    run over one clinic's ledger or several clinics combined.
+    """
+    def __init__(self, daily_aggregates, schedule_capacity):
+        self.daily_aggregates = daily_aggregates
+        self.schedule_capacity = schedule_capacity
+
+    def _filtered(self, start_date=None, end_date=None):
+        agg = self.daily_aggregates()
+        if start_date is not None:
+            agg = agg[agg['appointment_date'] >= start_date]
+        if end_date is not None:
+            agg = agg[agg['appointment_date'] <= end_date]
+        return agg
+
+    def _capacity_between(self, start_date=None, end_date=None):
+        capacity = self.schedule_capacity()
+        if start_date is not None:
+            capacity = capacity[capacity['appointment_date'] >= start_date]
+        if end_date is not None:
+            capacity = capacity[capacity['appointment_date'] <= end_date]
+        return capacity
+
+    def doctor_utilisation(self, start_date=None, end_date=None):
+        """Per-doctor slot utilisation and booked minutes"""
+        capacity = (
+            self._capacity_between(start_date, end_date)
+            .groupby('doctor')[['total_slots', 'booked_slots']].sum()
+            .reset_index()
+        )
+        booked = (
+            self._filtered(start_date, end_date)
+            .groupby('doctor')[['appointments', 'booked_minutes']].sum()
+            .reset_index()
+        )
+        report = capacity.merge(booked, on='doctor', how='outer').fillna(0)
+        report['utilisation'] = (report['booked_slots'] / report['total_slots'].where(report['total_slots'] > 0)).fillna(0.0)
+        return report.sort_values('doctor', ignore_index=True)
+
+    def daily_utilisation(self, start_date=None, end_date=None):
+        """Per-day, per-doctor slot utilisation and booked minutes"""
+        capacity = self._capacity_between(start_date, end_date)
+        booked = (
+            self._filtered(start_date, end_date)
+            .groupby(['appointment_date', 'doctor'])[['appointments', 'booked_minutes']].sum()
+            .reset_index()
+        )
+        report = capacity.merge(booked, on=['appointment_date', 'doctor'], how='outer').fillna(0)
+        report['utilisation'] = (report['booked_slots'] / report['total_slots'].where(report['total_slots'] > 0)).fillna(0.0)
+        return report.sort_values(['appointment_date', 'doctor'], ignore_index=True)
+
+    def _share(self, key, start_date=None, end_date=None):
+        counts = self._filtered(start_date, end_date).groupby(key)['appointments'].sum()
+        total = counts.sum()
+        report = counts.rename('appointments').reset_index()
+        report['share'] = report['appointments'] / total if total else 0.0
+        return report.sort_values('appointments', ascending=False, ignore_index=True)
+
+    def duration_mix(self, start_date=None, end_date=None):
+        """Appointment counts and share by duration"""
+        return self._share('duration_min', start_date, end_date)
+
+    def insurance_breakdown(self, start_date=None, end_date=None):
+        """Appointment counts and share by insurance carrier"""
+        return self._share('insurance_carrier', start_date, end_date)
+
+    def patient_type_ratio(self, start_date=None, end_date=None):
+        """New vs returning patient counts and share"""
+        return self._share('patient_type', start_date, end_date)
+
+    def status_breakdown(self, start_date=None, end_date=None):
+        """Appointment counts by status, e.g. Confirmed, Cancelled, No-Show"""
+        return self._share('status', start_date, end_date)
+
+    def no_show_rate(self, start_date=None, end_date=None):
+        """Fraction of appointments recorded with a no-show status"""
+        agg = self._filtered(start_date, end_date)
+        total = agg['appointments'].sum()
+        if not total:
+            return 0.0
+        no_shows = agg.loc[agg['status'].str.lower().str.replace('-', '').str.replace(' ', '') == 'noshow', 'appointments'].sum()
+        return float(no_shows / total)
+
+
+class AppointmentReports:
+    """Ledger of one clinic's data directory (see for_data_dir); reports are on .queries"""
+    def __init__(self, ledger_dir=LEDGER_DIR, aggregates_dir=DAILY_AGGREGATES_DIR, schedule_path=SCHEDULE_PATH,
+                 excel_path=EXCEL_LEDGER_PATH, capacity_dir=CAPACITY_DIR):
+        self.ledger_dir = ledger_dir
+        self.schedule_path = schedule_path
+        self.excel_path = excel_path
+        self._aggregates = _MonthlyTable(aggregates_dir, AGGREGATE_COLUMNS, AGGREGATE_KEYS)
+        self._capacity = _MonthlyTable(capacity_dir, CAPACITY_COLUMNS, CAPACITY_KEYS)
+        self.queries = ReportQueries(self.daily_aggregates, self.schedule_capacity)
+
+    @classmethod
+    def for_data_dir(cls, data_dir):
+        """Reports over a clinic shard's files, e.g. data/clinics/<clinic_id>"""
+        return cls(
+            ledger_dir=os.path.join(data_dir, 'ledger'),
+            aggregates_dir=os.path.join(data_dir, 'ledger_daily'),
+            schedule_path=os.path.join(data_dir, 'doctor_schedules.csv'),
+            excel_path=os.path.join(data_dir, 'all_appointments.xlsx'),
+            capacity_dir=os.path.join(data_dir, 'ledger_capacity'),
+        )
+
+    # ------------------------------------------------------------------
+    # Ledger storage
+    # ------------------------------------------------------------------
+    def _partition_path(self, appointment_date):
+        return os.path.join(self.ledger_dir, f"date={appointment_date}.parquet")
+
+    def load_ledger(self, columns=None, dates=None):
+        """Read the columnar ledger, optionally projecting columns and restricting to dates"""
+        if dates is not None:
+            paths = [self._partition_path(d) for d in dates]
+            paths = [p for p in paths if os.path.exists(p)]
+        else:
+            paths = sorted(glob.glob(os.path.join(self.ledger_dir, 'date=*.parquet')))
+
+        if not paths:
+            return pd.DataFrame(columns=columns or list(LEDGER_COLUMNS.values()))
+        return pd.concat([pd.read_parquet(p, columns=columns) for p in paths], ignore_index=True)
+
+    def append(self, appointment: dict):
+        """Append one booking to its date partition and refresh that day's aggregates"""
+        new_rows = _normalise_ledger(pd.DataFrame([appointment]))
+        self._write_rows(new_rows)
+        self.refresh_daily_aggregates(new_rows['appointment_date'].unique())
+
+    def import_excel(self, path=None):
+        """Load the Excel ledger into the columnar ledger, replacing the dates it covers"""
+        try:
+            appointments = pd.read_excel(path or self.excel_path)
+        except Exception as e:
+            print(f"❌ Could not read Excel ledger: {e}")
+            return None
+
+        rows = _normalise_ledger(appointments)
+        # Rebuild the affected partitions from scratch so re-running the
+        # import does not duplicate rows
+        for appointment_date in rows['appointment_date'].unique():
+            path = self._partition_path(appointment_date)
+            if os.path.exists(path):
+                os.remove(path)
+        self._write_rows(rows)
+        self.refresh_daily_aggregates(rows['appointment_date'].unique())
+        print(f"✅ Imported {len(rows)} appointment(s) into the columnar ledger")
+        return len(rows)
+
+    def migrate_excel(self):
+        """One-off import of the Excel history, recorded with a marker in the ledger directory.
+
+        Call before appending a booking to the Excel file, so the first live
+        booking does not create a ledger that is missing every earlier one.
+        """
+        marker = os.path.join(self.ledger_dir, IMPORT_MARKER)
+        if os.path.exists(marker):
+            return False
+        if os.path.exists(self.excel_path) and self.import_excel() is None:
+            # Keep the history pending when the Excel file could not be read
+            return False
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        with open(marker, 'w') as f:
+            f.write(datetime.now().strftime('%Y-%m-%d %H:%M:%S') + '\n')
+        return True
+
+    def _write_rows(self, rows: pd.DataFrame):
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        for appointment_date, day_rows in rows.groupby('appointment_date'):
+            path = self._partition_path(appointment_date)
+            if os.path.exists(path):
+                day_rows = pd.concat([pd.read_parquet(path), day_rows], ignore_index=True)
+            tmp_path = path + '.tmp'
+            day_rows.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+    # ------------------------------------------------------------------
+    # Materialised daily aggregates
+    # ------------------------------------------------------------------
+    def refresh_daily_aggregates(self, dates=None):
+        """Recompute aggregates for the given dates (all dates when None)"""
+        ledger = self.load_ledger(dates=dates)
+        fresh = (
+            ledger.groupby(AGGREGATE_KEYS, dropna=False)
+            .agg(appointments=('doctor', 'size'), booked_minutes=('duration_min', 'sum'))
+            .reset_index()
+        )
+        if dates is None:
+            self._aggregates.replace_all(fresh)
+        else:
+            self._aggregates.replace_dates(fresh, dates)
+        return fresh
+
+    def daily_aggregates(self):
+        """Materialised (date, doctor, type, duration, carrier, status) counts"""
+        # Built from the ledger when it predates the monthly tables
+        if not self._aggregates.exists() and glob.glob(os.path.join(self.ledger_dir, 'date=*.parquet')):
+            self.refresh_daily_aggregates()
+        return self._aggregates.read()
+
+    def refresh_capacity(self, schedule=None, dates=None):
+        """Recompute per-(date, doctor) slot capacity.
+
+        schedule is the in-memory schedule frame when the caller has just
+        saved it (otherwise the schedule file is read); dates restricts the
+        refresh to the days that changed.
+        """
+        if schedule is None:
+            try:
+                schedule = pd.read_csv(self.schedule_path, usecols=['doctor', 'date', 'available'])
+            except Exception as e:
+                print(f"❌ Could not read schedule: {e}")
+                return pd.DataFrame(columns=CAPACITY_COLUMNS)
+
+        if dates is None:
+            fresh = _schedule_capacity(schedule)
+            self._capacity.replace_all(fresh)
+        else:
+            dates = [str(d) for d in dates]
+            fresh = _schedule_capacity(schedule[schedule['date'].astype(str).isin(dates)])
+            self._capacity.replace_dates(fresh, dates)
+        return fresh
+
+    def schedule_capacity(self):
+        """Materialised (date, doctor) total and booked slot counts"""
+        # Rebuilt from the schedule only when it was changed without a refresh
+        newest = self._capacity.newest_mtime()
+        schedule_mtime = os.path.getmtime(self.schedule_path) if os.path.exists(self.schedule_path) else None
+        if newest is None or (schedule_mtime is not None and schedule_mtime > newest):
+            self.refresh_capacity()
+        return self._capacity.read()
+
+
+class CombinedReports:
+    """Reports summed over several clinics' ledgers"""
+    def __init__(self, clinic_reports):
+        self.clinic_reports = list(clinic_reports)
+        self.queries = ReportQueries(self.daily_aggregates, self.schedule_capacity)
+
+    def migrate_excel(self):
+        return any([reports.migrate_excel() for reports in self.clinic_reports])
+
+    def daily_aggregates(self):
+        frames = [reports.daily_aggregates() for reports in self.clinic_reports]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=AGGREGATE_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def schedule_capacity(self):
+        frames = [reports.schedule_capacity() for reports in self.clinic_reports]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=CAPACITY_COLUMNS)
+        return pd.concat(frames, ignore_index=True).groupby(CAPACITY_KEYS, as_index=False).sum()
+
+
+if __name__ == "__main__":
+    import argparse
+    from clinics import load_registry
+
+    parser = argparse.ArgumentParser(description="Appointment reports from the columnar ledger")
+    parser.add_argument('--clinic', help="report on one clinic (default: all clinics combined)")
+    args = parser.parse_args()
+
+    registry = load_registry()
+    if args.clinic is not None and args.clinic not in registry:
+        parser.error(f"unknown clinic {args.clinic!r}; known: {', '.join(registry)}")
+    clinic_ids = [args.clinic] if args.clinic is not None else list(registry)
+    reports = CombinedReports(AppointmentReports.for_data_dir(registry[c]['data_dir']) for c in clinic_ids)
+    reports.migrate_excel()
+    queries = reports.queries
+    print(f"Report generated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} for {', '.join(clinic_ids)}")
+    print("\nDoctor utilisation:\n", queries.doctor_utilisation().to_string(index=False))
+    print("\nDuration mix:\n", queries.duration_mix().to_string(index=False))
+    print("\nInsurance carriers:\n", queries.insurance_breakdown().to_string(index=False))
+    print("\nNew vs returning:\n", queries.patient_type_ratio().to_string(index=False))
+    print(f"\nNo-show rate: {queries.no_show_rate():.1%}")
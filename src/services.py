@@ -0,0 +1,540 @@
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date as Date, datetime
+
+from phi_crypto import BLIND_INDEX_COLUMN, get_cipher
+from stores import DATA_DIR, STORE_FILES, load_stores, save_store, store_lock, store_signature, cached_signature, add_blind_index
+from slot_search import SlotIndex, slot_start, PREFERRED_DOCTOR_BONUS, CONTINUITY_BONUS
+
+# (event, worker method) pairs run for each conversation event. Booking the
+# slot and saving the appointment decide the conversation's next step, so the
+# engine calls those directly; workers only follow an outcome.
+WORKERS = [
+    ('confirmed', 'add_new_patient'),
+]
+
+
+class SchedulingServices:
+    """Stores and side-effect workers for one clinic, shared by its conversations"""
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        stores = load_stores(data_dir)
+        self.patient_db = stores['patient_db']
+        self.schedule_db = stores['schedule_db']
+        self.all_appointments = stores['all_appointments']
+        # Store signatures our frames were read at, to notice other writers
+        self._signatures = {name: cached_signature(name, data_dir) for name in STORE_FILES}
+        
+        # Serialises writes to the shared frames and their backing files;
+        # locked() adds the store lock other processes take
+        self.lock = threading.RLock()
+        self._lock_depth = 0
+        self._reports = None
+        self._patient_index = None
+        self._slot_index = None
+        self._previous_doctors = None
+    
+    @property
+    def reports(self):
+        """Columnar reporting ledger, created on first booking"""
+        if self._reports is None:
+            from reporting import AppointmentReports
+            self._reports = AppointmentReports.for_data_dir(self.data_dir)
+        return self._reports
+    
+    def subscribe_workers(self, events):
+        """Attach the side-effect workers to conversation events"""
+        for event, worker in WORKERS:
+            events.subscribe(event, getattr(self, worker))
+    
+    @contextmanager
+    def locked(self):
+        """Hold self.lock and this clinic's inter-process store lock, then sync.
+        
+        Wrap every check-then-write in it, so no other process can write the
+        stores between the sync, the check and the save. Reentrant.
+        """
+        with self.lock:
+            self._lock_depth += 1
+            try:
+                if self._lock_depth > 1:
+                    yield
+                    return
+                with store_lock(self.data_dir):
+                    self._sync()
+                    yield
+            finally:
+                self._lock_depth -= 1
+    
+    def _sync(self):
+        """Reload stores another process has written since we last read or wrote them.
+        
+        Call with self.lock held before reading; writers get it from locked().
+        """
+        stale = [name for name in STORE_FILES if store_signature(name, self.data_dir) != self._signatures[name]]
+        if not stale:
+            return
+        for name, frame in load_stores(self.data_dir, stale).items():
+            setattr(self, name, frame)
+            self._signatures[name] = cached_signature(name, self.data_dir)
+        # Derived indexes are rebuilt from the reloaded frames on next use
+        if 'schedule_db' in stale:
+            self._slot_index = None
+        if 'patient_db' in stale:
+            self._patient_index = None
+        if 'all_appointments' in stale:
+            self._previous_doctors = None
+        print(f"🔄 Reloaded {', '.join(stale)} changed on disk")
+    
+    def _save(self, name):
+        """Write one of our frames back to its store"""
+        save_store(name, getattr(self, name), self.data_dir)
+        self._signatures[name] = cached_signature(name, self.data_dir)
+    
+    def find_patient(self, first_name, last_name, dob):
+        """Check whether a patient with this name and DOB is on file"""
+        with self.lock:
+            self._sync()
+        cipher = get_cipher()
+        if cipher is not None:
+            # Encrypted stores are looked up through the name + DOB blind index
+            if self._patient_index is None:
+                with self.lock:
+                    add_blind_index(self.patient_db, cipher)
+                    self._patient_index = set(self.patient_db[BLIND_INDEX_COLUMN])
+            return cipher.blind_index(first_name, last_name, dob) in self._patient_index
+        
+        patient_db = self.patient_db
+        found_patient = patient_db[
+            (patient_db['first_name'].str.contains(first_name, case=False)) &
+            (patient_db['last_name'].str.contains(last_name, case=False)) &
+            (patient_db['dob'] == dob)
+        ]
+        return len(found_patient) > 0
+    
+    def available_slots(self):
+        """Get available slots considering appointment duration"""
+        return self.schedule_db[self.schedule_db['available'] == True]
+    
+    @property
+    def slot_index(self):
+        """Per-doctor sorted free lists, built on first search"""
+        if self._slot_index is None:
+            with self.lock:
+                if self._slot_index is None:
+                    self._slot_index = SlotIndex(self.schedule_db)
+        return self._slot_index
+    
+    def previous_doctor(self, name, dob):
+        """Doctor of the patient's most recent booking in the ledger, if any"""
+        if not name or not dob:
+            return None
+        if self._previous_doctors is None:
+            with self.lock:
+                appointments = self.all_appointments
+                previous = {}
+                if {'Patient Name', 'Date of Birth', 'Doctor'} <= set(appointments.columns):
+                    # Later bookings overwrite earlier ones
+                    for patient, patient_dob, doctor in zip(appointments['Patient Name'], appointments['Date of Birth'], appointments['Doctor']):
+                        if isinstance(patient, str) and isinstance(doctor, str):
+                            previous[(patient.strip().lower(), str(patient_dob))] = doctor
+                self._previous_doctors = previous
+        return self._previous_doctors.get((name.strip().lower(), dob))
+    
+    def search_slots(self, limit=10, preferred_doctor=None, time_of_day=None, patient_name=None, dob=None, start_date=None):
+        """Ranked free slots from start_date (default today): earliest first, boosted for the preferred and previous doctor"""
+        start_date = start_date or Date.today().isoformat()
+        with self.lock:
+            self._sync()
+        bonuses = {}
+        previous = self.previous_doctor(patient_name, dob)
+        if previous:
+            bonuses[previous] = CONTINUITY_BONUS
+        if preferred_doctor:
+            bonuses[preferred_doctor] = bonuses.get(preferred_doctor, 0) + PREFERRED_DOCTOR_BONUS
+        
+        with self.lock:
+            results = self.slot_index.search(limit, bonuses, time_of_day, start_date=start_date)
+        for slot in results:
+            if slot['doctor'] == previous:
+                slot['reason'] = 'your previous doctor'
+            elif slot['doctor'] == preferred_doctor:
+                slot['reason'] = 'preferred doctor'
+        return results
+    
+    def has_available_slots(self):
+        """Whether any slot from today on is still free"""
+        try:
+            return bool(self.search_slots(1))
+        except Exception as e:
+            print(f"Error getting available slots: {e}")
+            return False
+    
+    def mark_slots_as_booked(self, session):
+        """Mark time slots as booked based on appointment duration.
+        
+        Returns False, booking nothing, unless every slot the appointment
+        needs is in the schedule and still free.
+        """
+        doctor, date, time, duration = session.doctor, session.date, session.time, session.duration
+        try:
+            # For 60min appointments, we need to block the next 30min slot too.
+            # Slots are compared by start minute, since times are stored as
+            # '9:30' but may be written '09:30'.
+            start = slot_start(date, time)
+            starts = [start, start + 30] if duration == 60 else [start]
+            
+            with self.locked():
+                schedule = self.schedule_db
+                day = schedule[(schedule['doctor'] == doctor) & (schedule['date'].astype(str) == str(date))]
+                rows = {slot_start(d, t): label for label, d, t in zip(day.index, day['date'], day['time'])}
+                
+                # Sessions share the schedule, so check and book in one step
+                if any(s not in rows or schedule.at[rows[s], 'available'] != True for s in starts):
+                    print(f"❌ Slot {doctor} {date} {time} is not free for a {duration}min appointment")
+                    return False
+                
+                # Update schedule database
+                for s in starts:
+                    label = rows[s]
+                    schedule.at[label, 'available'] = False
+                    if self._slot_index is not None:
+                        self._slot_index.remove(doctor, schedule.at[label, 'date'], schedule.at[label, 'time'])
+                
+                # Save updated schedule
+                self._save('schedule_db')
+                try:
+                    self.reports.refresh_capacity(self.schedule_db, [date])
+                except Exception as e:
+                    print(f"❌ Reporting capacity update failed: {e}")
+            print(f"✅ Marked {len(starts)} slot(s) as booked for {duration}min appointment")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Error marking slots as booked: {e}")
+            return False
+    
+    def add_new_patient(self, session):
+        """Add new patient to the database so they become returning next time"""
+        if session.patient_type != 'new':
+            return False
+        try:
+            name_parts = session.name.split()
+            if len(name_parts) < 2:
+                return False
+            first_name, last_name = name_parts[0], name_parts[1]
+            
+            # Create new patient record
+            new_patient = {
+                'first_name': first_name,
+                'last_name': last_name,
+                'dob': session.dob,
+                'email': session.email or '',
+                'phone': '',  # You can collect this later
+                'is_returning': True,  # They'll be returning next time
+                'insurance_carrier': session.carrier or '',
+                'member_id': session.member_id or '',
+                'group_number': session.group_number or ''
+            }
+            
+            import pandas as pd
+            
+            with self.locked():
+                # Append new patient and save
+                self.patient_db = pd.concat([self.patient_db, pd.DataFrame([new_patient])], ignore_index=True)
+                self._save('patient_db')
+                if self._patient_index is not None:
+                    self._patient_index.update(self.patient_db[BLIND_INDEX_COLUMN].iloc[-1:])
+            
+            print(f"✅ Added new patient to database: {session.name}")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Error adding patient to database: {e}")
+            return False
+    
+    def export_appointment(self, session):
+        """Export appointment to Excel master file and the reporting ledger"""
+        try:
+            # Create new appointment record
+            new_appointment = {
+                'Patient Name': session.name,
+                'Patient Type': session.patient_type,
+                'Patient Email': session.email,
+                'Date of Birth': session.dob,
+                'Doctor': session.doctor,
+                'Appointment Date': session.date,
+                'Appointment Time': session.time,
+                'Duration (min)': session.duration,
+                'Insurance Carrier': session.carrier,
+                'Member ID': session.member_id,
+                'Group Number': session.group_number,
+                'Status': 'Confirmed',
+                'Booking Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            
+            import pandas as pd
+            
+            with self.locked():
+                # Bring earlier Excel bookings into the ledger before this one is added
+                try:
+                    self.reports.migrate_excel()
+                except Exception as e:
+                    print(f"❌ Reporting ledger migration failed: {e}")
+                
+                # Append to existing appointments or create new DataFrame
+                if self.all_appointments.empty:
+                    self.all_appointments = pd.DataFrame([new_appointment])
+                else:
+                    self.all_appointments = pd.concat([self.all_appointments, pd.DataFrame([new_appointment])], ignore_index=True)
+                
+                # Save to Excel
+                self._save('all_appointments')
+                if self._previous_doctors is not None and session.name and session.doctor:
+                    self._previous_doctors[(session.name.strip().lower(), str(session.dob))] = session.doctor
+                print("✅ Excel export completed")
+                
+                # Keep the columnar reporting ledger in step with the Excel export
+                try:
+                    self.reports.append(new_appointment)
+                except Exception as e:
+                    print(f"❌ Reporting ledger update failed: {e}")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Excel export failed: {e}")
+            return False
+    
+    def send_confirmation_email(self, session):
+        """Send confirmation email with beautiful HTML template"""
+        try:
+            import smtplib
+            from email.mime.text import MIMEText
+            from email.mime.multipart import MIMEMultipart
+            from email.mime.application import MIMEApplication
+            from dotenv import load_dotenv
+            
+            load_dotenv()
+            email_user = os.getenv("EMAIL_USER")
+            email_password = os.getenv("EMAIL_PASSWORD")
+            to_email = session.email
+            
+            if not email_user or not email_password:
+                print("Email credentials not configured")
+                return False
+            
+            if not to_email:
+                print("No recipient email address")
+                return False
+            
+            # Check if PDF form exists
+            pdf_path = 'data/patient_intake_form.pdf'
+            pdf_exists = pdf_path and os.path.exists(pdf_path)
+            
+            # Create email message with HTML content
+            msg = MIMEMultipart('alternative')
+            msg['From'] = f"Medical Clinic <{email_user}>"
+            msg['To'] = to_email
+            msg['Subject'] = "✅ Your Appointment Confirmation - Medical Clinic"
+            
+            # Beautiful HTML email template
+            html_content = f"""
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <meta charset="utf-8">
+                <style>
+                    body {{
+                        font-family: 'Arial', sans-serif;
+                        line-height: 1.6;
+                        color: #333;
+                        max-width: 600px;
+                        margin: 0 auto;
+                        padding: 20px;
+                        background-color: #f9f9f9;
+                    }}
+                    .header {{
+                        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+                        color: white;
+                        padding: 30px;
+                        text-align: center;
+                        border-radius: 10px 10px 0 0;
+                    }}
+                    .content {{
+                        background: white;
+                        padding: 30px;
+                        border-radius: 0 0 10px 10px;
+                        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+                    }}
+                    .appointment-details {{
+                        background: #f8f9fa;
+                        padding: 20px;
+                        border-radius: 8px;
+                        margin: 20px 0;
+                        border-left: 4px solid #667eea;
+                    }}
+                    .detail-item {{
+                        margin: 10px 0;
+                        display: flex;
+                        justify-content: space-between;
+                    }}
+                    .detail-label {{
+                        font-weight: bold;
+                        color: #555;
+                    }}
+                    .button {{
+                        display: inline-block;
+                        padding: 15px 30px;
+                        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+                        color: white;
+                        text-decoration: none;
+                        border-radius: 25px;
+                        margin: 20px 0;
+                        font-weight: bold;
+                    }}
+                    .footer {{
+                        text-align: center;
+                        margin-top: 30px;
+                        padding-top: 20px;
+                        border-top: 1px solid #eee;
+                        color: #666;
+                        font-size: 12px;
+                    }}
+                    .highlight {{
+                        background: #fff3cd;
+                        padding: 10px;
+                        border-radius: 5px;
+                        border-left: 4px solid #ffc107;
+                        margin: 15px 0;
+                    }}
+                </style>
+            </head>
+            <body>
+                <div class="header">
+                    <h1>🏥 Medical Clinic</h1>
+                    <p>Your Health is Our Priority</p>
+                </div>
+                
+                <div class="content">
+                    <h2>Appointment Confirmed! ✅</h2>
+                    <p>Dear <strong>{session.name}</strong>,</p>
+                    <p>Your appointment has been successfully scheduled. We're looking forward to seeing you!</p>
+                    
+                    <div class="appointment-details">
+                        <h3>📅 Appointment Details</h3>
+                        <div class="detail-item">
+                            <span class="detail-label">Doctor:</span>
+                            <span>👨‍⚕️ {session.doctor}</span>
+                        </div>
+                        <div class="detail-item">
+                            <span class="detail-label">Date:</span>
+                            <span>📅 {session.date}</span>
+                        </div>
+                        <div class="detail-item">
+                            <span class="detail-label">Time:</span>
+                            <span>⏰ {session.time}</span>
+                        </div>
+                        <div class="detail-item">
+                            <span class="detail-label">Duration:</span>
+                            <span>⏱️ {session.duration} minutes ({session.patient_type} patient)</span>
+                        </div>
+                    </div>
+                    
+                    <div class="appointment-details">
+                        <h3>📋 Insurance Information</h3>
+                        <div class="detail-item">
+                            <span class="detail-label">Carrier:</span>
+                            <span>🏢 {session.carrier or 'Not provided'}</span>
+                        </div>
+                        <div class="detail-item">
+                            <span class="detail-label">Member ID:</span>
+                            <span>🔖 {session.member_id or 'Not provided'}</span>
+                        </div>
+                        <div class="detail-item">
+                            <span class="detail-label">Group Number:</span>
+                            <span>👥 {session.group_number or 'Not provided'}</span>
+                        </div>
+                    </div>
+                    
+                    <div class="highlight">
+                        <h4>📎 Important Documents Attached</h4>
+                        <p>We've attached the patient intake form for you to complete before your visit.</p>
+                    </div>
+                    
+                    <div style="text-align: center;">
+                        <p>Please arrive <strong>15 minutes early</strong> for your appointment.</p>
+                        <p>Bring your insurance card and photo ID.</p>
+                    </div>
+                    
+                    <div class="footer">
+                        <p>📍 123 Medical Center Drive, Healthcare City</p>
+                        <p>📞 (555) 123-4567 | ✉️ info@medicalclinic.com</p>
+                        <p>© 2024 Medical Clinic. All rights reserved.</p>
+                    </div>
+                </div>
+            </body>
+            </html>
+            """
+            
+            # Plain text version for email clients that don't support HTML
+            text_content = f"""
+            APPOINTMENT CONFIRMATION - MEDICAL CLINIC
+            
+            Dear {session.name},
+            
+            Your appointment has been confirmed:
+            
+            DOCTOR: {session.doctor}
+            DATE: {session.date}
+            TIME: {session.time}
+            DURATION: {session.duration} minutes ({session.patient_type} patient)
+            
+            INSURANCE INFORMATION:
+            - Carrier: {session.carrier or 'Not provided'}
+            - Member ID: {session.member_id or 'Not provided'}
+            - Group Number: {session.group_number or 'Not provided'}
+            
+            Please arrive 15 minutes early for your appointment.
+            Bring your insurance card and photo ID.
+            
+            We've attached the patient intake form for you to complete.
+            
+            Contact Information:
+            📍 123 Medical Center Drive, Healthcare City
+            📞 (555) 123-4567
+            ✉️ info@medicalclinic.com
+            """
+            
+            # Attach both HTML and plain text versions
+            part1 = MIMEText(text_content, 'plain')
+            part2 = MIMEText(html_content, 'html')
+            msg.attach(part1)
+            msg.attach(part2)
+            
+            # Attach PDF file if it exists
+            if pdf_exists:
+                try:
+                    with open(pdf_path, 'rb') as f:
+                        attach = MIMEApplication(f.read(), _subtype='pdf')
+                        attach.add_header('Content-Disposition', 'attachment', 
+                                        filename='Patient_Intake_Form.pdf')
+                        msg.attach(attach)
+                    print(f"✅ Attachment added: {pdf_path}")
+                except Exception as e:
+                    print(f"❌ Failed to attach file: {e}")
+            
+            # Send email
+            server = smtplib.SMTP('smtp.gmail.com', 587)
+            server.starttls()
+            server.login(email_user, email_password)
+            server.sendmail(email_user, to_email, msg.as_string())
+            server.quit()
+            
+            print(f"✅ Beautiful email sent to: {to_email}")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Email sending failed: {e}")
+            return False
+
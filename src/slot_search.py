@@ -0,0 +1,126 @@
+import heapq
+from bisect import bisect_left
+from functools import lru_cache
+from collections import defaultdict
+from datetime import date as Date
+
+# Ranked slot search. Free slots are kept in one sorted list per doctor,
+# keyed by start time in minutes, plus one per (time of day, doctor) so a
+# time-of-day filter never scans slots outside its window. A doctor-level
+# bonus (preferred doctor, continuity of care) shifts a whole list by a
+# constant, so every list stays sorted by score and the top k come from a
+# heap merge over the doctors' list heads in O(k log doctors).
+
+MINUTES_PER_DAY = 24 * 60
+
+# How much earlier (in minutes) a slot effectively ranks for these doctors
+PREFERRED_DOCTOR_BONUS = 2 * MINUTES_PER_DAY
+CONTINUITY_BONUS = MINUTES_PER_DAY
+
+TIME_OF_DAY = {
+    'morning': (0, 12 * 60),
+    'afternoon': (12 * 60, 17 * 60),
+    'evening': (17 * 60, MINUTES_PER_DAY),
+}
+
+
+# Schedules repeat the same few dates and times, so parsing is memoised
+@lru_cache(maxsize=4096)
+def _day_start(date):
+    return Date.fromisoformat(str(date)).toordinal() * MINUTES_PER_DAY
+
+
+@lru_cache(maxsize=1024)
+def _minute_of_day(time):
+    hours, minutes = str(time).split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def _window(minute_of_day):
+    for window, (low, high) in TIME_OF_DAY.items():
+        if low <= minute_of_day < high:
+            return window
+    return None
+
+
+def slot_start(date, time):
+    """Absolute start of a slot in minutes, from 'YYYY-MM-DD' and 'H:MM'"""
+    return _day_start(date) + _minute_of_day(time)
+
+
+class SlotIndex:
+    """Per-doctor sorted free lists over one clinic's schedule"""
+    def __init__(self, schedule_db):
+        import pandas as pd
+
+        self._free = defaultdict(list)
+        # time of day -> doctor -> the doctor's free slots in that window
+        self._windows = {window: {} for window in TIME_OF_DAY}
+        free = schedule_db.loc[schedule_db['available'] == True, ['doctor', 'date', 'time']]
+        if free.empty:
+            return
+
+        # Parse each distinct date and time once, then sort in one pass
+        dates, times = free['date'].astype(str), free['time'].astype(str)
+        starts = (dates.map({d: _day_start(d) for d in dates.unique()}) +
+                  times.map({t: _minute_of_day(t) for t in times.unique()}))
+        free = free.assign(start=starts).sort_values(['doctor', 'start'], kind='stable', ignore_index=True)
+        edges = [low for low, _ in TIME_OF_DAY.values()] + [MINUTES_PER_DAY]
+        free['window'] = pd.cut(free['start'] % MINUTES_PER_DAY, edges, right=False, labels=list(TIME_OF_DAY))
+
+        # Every list shares the same slot tuples; positions keep start order
+        slots = list(zip(free['start'].tolist(), free['date'].tolist(), free['time'].tolist()))
+        for doctor, positions in free.groupby('doctor', sort=False).indices.items():
+            self._free[doctor] = [slots[i] for i in positions]
+        for (window, doctor), positions in free.groupby(['window', 'doctor'], observed=True, sort=False).indices.items():
+            self._windows[window][doctor] = [slots[i] for i in positions]
+
+    def __len__(self):
+        return sum(len(slots) for slots in self._free.values())
+
+    def doctors(self):
+        return list(self._free)
+
+    def remove(self, doctor, date, time):
+        """Drop a slot that has just been booked"""
+        start = slot_start(date, time)
+        window = _window(start % MINUTES_PER_DAY)
+        for lists in (self._free, self._windows[window] if window else {}):
+            slots = lists.get(doctor)
+            if not slots:
+                continue
+            position = bisect_left(slots, (start,))
+            if position < len(slots) and slots[position][0] == start:
+                del slots[position]
+
+    def search(self, limit=10, bonuses=None, time_of_day=None, doctors=None, start_date=None):
+        """Top `limit` free slots by start time minus any doctor bonus.
+
+        bonuses maps doctor -> minutes; time_of_day is 'morning',
+        'afternoon' or 'evening'; doctors restricts the search; start_date
+        ('YYYY-MM-DD') skips earlier slots.
+        """
+        bonuses = bonuses or {}
+        lists = self._windows.get(time_of_day, self._free)
+        earliest = slot_start(start_date, '0:00') if start_date else None
+
+        heap = []
+        for doctor, slots in lists.items():
+            if doctors and doctor not in doctors:
+                continue
+            position = bisect_left(slots, (earliest,)) if earliest is not None else 0
+            if position < len(slots):
+                heap.append((slots[position][0] - bonuses.get(doctor, 0), doctor, position))
+        heapq.heapify(heap)
+
+        results = []
+        while heap and len(results) < limit:
+            score, doctor, position = heapq.heappop(heap)
+            slots = lists[doctor]
+            _, date, time = slots[position]
+            results.append({'doctor': doctor, 'date': date, 'time': time, 'score': score})
+
+            position += 1
+            if position < len(slots):
+                heapq.heappush(heap, (slots[position][0] - bonuses.get(doctor, 0), doctor, position))
+        return results
@@ -0,0 +1,351 @@
+import os
+import mmap
+import pickle
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory file locks (Windows): writers are only serialised within a process
+    fcntl = None
+
+from phi_crypto import (
+    PHI_COLUMNS, BLIND_INDEX_COLUMN, SidecarMismatchError, get_cipher, sidecar_path, source_digest,
+    seal_columns, open_columns, commit_sidecar, rotated_blind_indexes, rotate_key,
+)
+
+# Parsed copies of the CSV/Excel stores are kept in a binary snapshot so a
+# new process does not have to re-parse them (openpyxl is especially slow).
+# Each entry records the source file's mtime and size and is only reused
+# while those still match. With PHI encryption enabled the snapshot itself
+# is sealed as a single AES-GCM blob. Writes grouped in snapshot_batch()
+# rewrite the snapshot once per batch rather than once per store.
+#
+# Every clinic shard keeps the same set of files in its own data directory,
+# with its own snapshot.
+DATA_DIR = 'data'
+SNAPSHOT_FILE = '.stores_snapshot.pkl'
+LOCK_FILE = '.stores.lock'
+
+STORE_FILES = {
+    'patient_db': 'patients.csv',
+    'schedule_db': 'doctor_schedules.csv',
+    'all_appointments': 'all_appointments.xlsx',
+}
+
+EMPTY_STORE_COLUMNS = {
+    'patient_db': ['first_name', 'last_name', 'dob', 'is_returning'],
+    'schedule_db': ['doctor', 'date', 'time', 'available'],
+    'all_appointments': [],
+}
+
+class StoreUnavailableError(RuntimeError):
+    """A store that cannot be read safely, e.g. its PHI sidecar does not match it"""
+
+
+# data dir -> {name -> (signature, DataFrame)}; shared by every agent in this process
+_process_cache = {}
+
+# Writes inside snapshot_batch() defer the snapshot to the end of the batch,
+# so one booking (several store writes) serialises the stores once
+_batch = threading.local()
+
+
+def store_path(name, data_dir=DATA_DIR):
+    return os.path.join(data_dir, STORE_FILES[name])
+
+
+@contextmanager
+def store_lock(data_dir=DATA_DIR):
+    """Exclusive lock on a data directory's stores, held across processes.
+
+    Not reentrant: a process must not take it twice for the same directory.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+def _signature(path):
+    return (_file_signature(path), _file_signature(sidecar_path(path)))
+
+
+def _parse(path, data=None):
+    """Parse a store file, or its already-read bytes"""
+    import io
+    import pandas as pd
+
+    source = io.BytesIO(data) if data is not None else path
+    if path.endswith('.xlsx'):
+        return pd.read_excel(source)
+    return pd.read_csv(source)
+
+
+def _read_source(name, path):
+    # Imported on first use so importing this module stays cheap
+    import pandas as pd
+
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=EMPTY_STORE_COLUMNS[name])
+    try:
+        # Parsed from the same bytes its sidecar is checked against
+        with open(path, 'rb') as f:
+            data = f.read()
+        frame = _parse(path, data)
+    except Exception as e:
+        print(f"❌ Could not load {path}: {e}")
+        return pd.DataFrame(columns=EMPTY_STORE_COLUMNS[name])
+
+    cipher = get_cipher()
+    if cipher is None:
+        return frame
+    try:
+        return open_columns(frame, path, cipher, source_digest(data))
+    except SidecarMismatchError as e:
+        # Sealed files never hold PHI columns. One that does was rewritten in
+        # plaintext (e.g. by data_generator.py) and is the current data.
+        if not any(c in frame.columns for c in PHI_COLUMNS.get(name, ())):
+            raise StoreUnavailableError(
+                f"{e}. Restore {path} and its sidecar from the same backup, "
+                f"or rewrite {path} with its patient columns to seal it again"
+            ) from e
+        print(f"🔒 {path} was rewritten in plaintext; sealing its patient identifiers again")
+        _write_store(name, frame, path, cipher)
+        return frame
+    except Exception as e:
+        # e.g. a sidecar sealed under another key
+        raise StoreUnavailableError(f"Could not decrypt the patient identifiers of {path}: {e}") from e
+
+
+def _read_snapshot(data_dir):
+    snapshot_path = os.path.join(data_dir, SNAPSHOT_FILE)
+    cipher = get_cipher()
+    try:
+        with open(snapshot_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                if cipher is not None:
+                    return pickle.loads(cipher.open(buf, b'stores-snapshot'))
+                return pickle.loads(buf)
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        if cipher is not None:
+            # A snapshot that does not open under the key may be a plaintext
+            # one from before encryption was enabled; don't leave it around
+            _remove_snapshot(data_dir)
+        return {}
+
+
+def _remove_snapshot(data_dir):
+    snapshot_path = os.path.join(data_dir, SNAPSHOT_FILE)
+    if os.path.exists(snapshot_path):
+        os.remove(snapshot_path)
+
+
+def _write_snapshot(data_dir):
+    try:
+        os.makedirs(data_dir, exist_ok=True)
+        data = pickle.dumps(_process_cache[data_dir], protocol=pickle.HIGHEST_PROTOCOL)
+        cipher = get_cipher()
+        if cipher is not None:
+            data = cipher.seal(data, b'stores-snapshot')
+        snapshot_path = os.path.join(data_dir, SNAPSHOT_FILE)
+        tmp_path = f"{snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, snapshot_path)
+    except Exception as e:
+        print(f"❌ Could not write store snapshot: {e}")
+
+
+@contextmanager
+def snapshot_batch():
+    """Group store writes so the warm snapshot is rewritten once at the end"""
+    outer = getattr(_batch, 'dirty', None) is None
+    if outer:
+        _batch.dirty = set()
+    try:
+        yield
+    finally:
+        if outer:
+            dirty, _batch.dirty = _batch.dirty, None
+            for data_dir in dirty:
+                _write_snapshot(data_dir)
+
+
+def _snapshot_changed(data_dir):
+    dirty = getattr(_batch, 'dirty', None)
+    if dirty is None:
+        _write_snapshot(data_dir)
+    else:
+        dirty.add(data_dir)
+
+
+def _stale(cache, signatures, names):
+    return [name for name in names if name not in cache or cache[name][0] != signatures[name]]
+
+
+def load_stores(data_dir=DATA_DIR, names=None):
+    """Return fresh copies of the stores (all by default), parsing only sources that changed"""
+    names = list(names or STORE_FILES)
+    cipher = get_cipher()
+    if cipher is not None:
+        encrypt_stores(cipher, data_dir)
+    cache = _process_cache.setdefault(data_dir, {})
+    signatures = {name: _signature(store_path(name, data_dir)) for name in names}
+    stale = _stale(cache, signatures, names)
+
+    if stale:
+        snapshot = _read_snapshot(data_dir)
+        reparsed = False
+        for name in stale:
+            cached = snapshot.get(name)
+            if cached is not None and cached[0] == signatures[name]:
+                cache[name] = cached
+            else:
+                cache[name] = (signatures[name], _read_source(name, store_path(name, data_dir)))
+                reparsed = True
+        if reparsed:
+            _snapshot_changed(data_dir)
+
+    # Agents mutate their frames, so each one gets its own copy
+    return {name: cache[name][1].copy() for name in names}
+
+
+def store_signature(name, data_dir=DATA_DIR):
+    """(mtime, size) of a store's file and PHI sidecar as they are on disk now"""
+    return _signature(store_path(name, data_dir))
+
+
+def cached_signature(name, data_dir=DATA_DIR):
+    """Signature of a store as this process last loaded or saved it"""
+    return _process_cache[data_dir][name][0]
+
+
+def add_blind_index(frame, cipher):
+    """Fill in the name + DOB blind index for patient rows that lack one"""
+    if BLIND_INDEX_COLUMN not in frame.columns:
+        frame[BLIND_INDEX_COLUMN] = None
+    missing = frame[BLIND_INDEX_COLUMN].isna()
+    if missing.any():
+        rows = frame.loc[missing, ['first_name', 'last_name', 'dob']]
+        frame.loc[missing, BLIND_INDEX_COLUMN] = [
+            cipher.blind_index(first, last, dob)
+            for first, last, dob in zip(rows['first_name'], rows['last_name'], rows['dob'])
+        ]
+    return frame
+
+
+def _write_store(name, frame, path, cipher):
+    """Write a store to its source file, with its PHI columns sealed when cipher is given"""
+    phi_columns = PHI_COLUMNS.get(name) if cipher is not None else None
+    stored = frame
+    if phi_columns and name == 'patient_db':
+        add_blind_index(frame, cipher)
+    if phi_columns:
+        stored = frame.drop(columns=[c for c in phi_columns if c in frame.columns])
+
+    # Keep the extension so pandas picks the right writer
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{ext}"
+    if ext == '.xlsx':
+        stored.to_excel(tmp_path, index=False)
+    else:
+        stored.to_csv(tmp_path, index=False)
+    if not phi_columns:
+        os.replace(tmp_path, path)
+        return
+    
+    # The sidecar stays pending until its file is in place, so a crash in
+    # between leaves one that open_columns can still match to the file
+    with open(tmp_path, 'rb') as f:
+        source = source_digest(f.read())
+    seal_columns(frame, phi_columns, path, cipher, source)
+    os.replace(tmp_path, path)
+    commit_sidecar(path)
+
+
+def save_store(name, frame, data_dir=DATA_DIR):
+    """Write a store to its source file (PHI sealed when enabled) and refresh the cache"""
+    path = store_path(name, data_dir)
+    _write_store(name, frame, path, get_cipher())
+    _process_cache.setdefault(data_dir, {})[name] = (_signature(path), frame.copy())
+    _snapshot_changed(data_dir)
+
+
+def encrypt_stores(cipher, data_dir=DATA_DIR):
+    """Seal stores still in plaintext, i.e. written before encryption was enabled.
+
+    A PHI store without a sidecar has never been sealed; its identifiers are
+    moved into one and the plaintext snapshot is removed. Returns the names
+    of the stores sealed.
+    """
+    sealed = []
+    for name in PHI_COLUMNS:
+        path = store_path(name, data_dir)
+        if not os.path.exists(path) or os.path.exists(sidecar_path(path)):
+            continue
+        try:
+            frame = _parse(path)
+        except Exception as e:
+            # Leave the file alone rather than sealing a partial read
+            print(f"❌ Could not encrypt {path}: {e}")
+            continue
+        if not any(c in frame.columns for c in PHI_COLUMNS[name]):
+            # Already sealed, with its sidecar still pending; see open_columns
+            continue
+        _write_store(name, frame, path, cipher)
+        _process_cache.get(data_dir, {}).pop(name, None)
+        sealed.append(name)
+        print(f"🔒 Encrypted patient identifiers in {path}")
+
+    if sealed:
+        _remove_snapshot(data_dir)
+    return sealed
+
+
+def rotate_store_keys(old_cipher, new_cipher, data_dir=DATA_DIR):
+    """Re-encrypt every sealed store under new_cipher, one chunk at a time"""
+    with store_lock(data_dir):
+        for name in STORE_FILES:
+            path = store_path(name, data_dir)
+            if not os.path.exists(sidecar_path(path)):
+                continue
+            # Blind indexes are keyed too, so the file's index column changes
+            # with the key; the new sidecar is written for the new file
+            blind_indexes = rotated_blind_indexes(path, old_cipher, new_cipher)
+            if blind_indexes is None:
+                with open(path, 'rb') as f:
+                    rotate_key(path, old_cipher, new_cipher, source_digest(f.read()))
+            else:
+                import pandas as pd
+                
+                frame = pd.read_csv(path)
+                frame[BLIND_INDEX_COLUMN] = blind_indexes
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                frame.to_csv(tmp_path, index=False)
+                with open(tmp_path, 'rb') as f:
+                    rotate_key(path, old_cipher, new_cipher, source_digest(f.read()))
+                os.replace(tmp_path, path)
+            commit_sidecar(path)
+            print(f"✅ Re-encrypted {sidecar_path(path)}")
+
+        # The snapshot was sealed with the old key; let the next start rebuild it
+        _remove_snapshot(data_dir)
+        _process_cache.pop(data_dir, None)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app runs its modules from src/ rather than as an installed package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
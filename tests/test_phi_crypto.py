@@ -0,0 +1,154 @@
+import os
+
+import pandas as pd
+import pytest
+
+import phi_crypto
+import stores
+from phi_crypto import PHICipher, SidecarMismatchError, BLIND_INDEX_COLUMN
+
+
+def _patients():
+    return pd.DataFrame({
+        'patient_id': [f"P{i}" for i in range(8)],
+        'first_name': [f"first{i}" for i in range(8)],
+        'last_name': [f"last{i}" for i in range(8)],
+        'dob': ['01/02/1990'] * 8,
+        'phone': ['555-0100', None, '555-0102', None, '555-0104', '555-0105', None, '555-0107'],
+        'email': [f"p{i}@example.com" for i in range(8)],
+        'is_returning': [True, False] * 4,
+        'member_id': [f"M{i}" for i in range(8)],
+        'group_number': [None] * 8,
+    })
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Several chunks per column, with a short last one
+    monkeypatch.setattr(phi_crypto, 'CHUNK_ROWS', 3)
+
+
+@pytest.fixture
+def use_cipher(monkeypatch):
+    def use(cipher):
+        monkeypatch.setattr(phi_crypto, '_cipher', cipher)
+        monkeypatch.setattr(phi_crypto, '_cipher_loaded', True)
+        stores._process_cache.clear()
+    return use
+
+
+def _cipher():
+    return PHICipher(os.urandom(32))
+
+
+def _values(series):
+    # Missing values come back as None or NaN depending on the column
+    return [None if pd.isna(value) else value for value in series]
+
+
+def test_sidecar_round_trip(tmp_path, small_chunks):
+    cipher = _cipher()
+    frame = _patients()
+    path = str(tmp_path / 'patients.csv')
+    columns = phi_crypto.PHI_COLUMNS['patient_db']
+
+    phi_crypto.seal_columns(frame, columns, path, cipher, 'digest')
+    phi_crypto.commit_sidecar(path)
+    stored = frame.drop(columns=columns)
+    opened = phi_crypto.open_columns(stored, path, cipher, 'digest')
+
+    assert list(opened.columns) == list(frame.columns)
+    for column in frame.columns:
+        assert _values(opened[column]) == _values(frame[column])
+
+
+def test_sidecar_refuses_another_file(tmp_path):
+    cipher = _cipher()
+    frame = _patients()
+    path = str(tmp_path / 'patients.csv')
+    phi_crypto.seal_columns(frame, ['first_name'], path, cipher, 'old')
+    phi_crypto.commit_sidecar(path)
+
+    with pytest.raises(SidecarMismatchError):
+        phi_crypto.open_columns(frame.drop(columns=['first_name']), path, cipher, 'new')
+
+
+def test_pending_sidecar_completes_interrupted_write(tmp_path):
+    cipher = _cipher()
+    frame = _patients()
+    path = str(tmp_path / 'patients.csv')
+    phi_crypto.seal_columns(frame, ['first_name'], path, cipher, 'old')
+    phi_crypto.commit_sidecar(path)
+    # The new file was written, but its sidecar was never moved into place
+    renamed = frame.assign(first_name=frame['first_name'].str.upper())
+    phi_crypto.seal_columns(renamed, ['first_name'], path, cipher, 'new')
+
+    opened = phi_crypto.open_columns(frame.drop(columns=['first_name']), path, cipher, 'new')
+    assert opened['first_name'].tolist() == renamed['first_name'].tolist()
+    assert not os.path.exists(phi_crypto.pending_path(path))
+
+
+def test_store_round_trip_and_key_rotation(tmp_path, small_chunks, use_cipher):
+    data_dir = str(tmp_path)
+    old, new = _cipher(), _cipher()
+    use_cipher(old)
+    stores.save_store('patient_db', _patients(), data_dir)
+    with open(stores.store_path('patient_db', data_dir)) as f:
+        assert 'first0' not in f.read()
+
+    stores.rotate_store_keys(old, new, data_dir)
+    use_cipher(new)
+    loaded = stores.load_stores(data_dir, ['patient_db'])['patient_db']
+
+    expected = _patients()
+    assert loaded['first_name'].tolist() == expected['first_name'].tolist()
+    assert _values(loaded['phone']) == _values(expected['phone'])
+    assert loaded[BLIND_INDEX_COLUMN].tolist() == [
+        new.blind_index(f, l, d) for f, l, d in zip(expected['first_name'], expected['last_name'], expected['dob'])
+    ]
+
+    use_cipher(old)
+    with pytest.raises(stores.StoreUnavailableError):
+        stores.load_stores(data_dir, ['patient_db'])
+
+
+def test_store_interrupted_before_sidecar_commit(tmp_path, monkeypatch, use_cipher):
+    data_dir = str(tmp_path)
+    use_cipher(_cipher())
+    stores.save_store('patient_db', _patients(), data_dir)
+
+    def crash(path):
+        raise RuntimeError("crash")
+
+    monkeypatch.setattr(stores, 'commit_sidecar', crash)
+    with pytest.raises(RuntimeError):
+        stores.save_store('patient_db', _patients().iloc[:5], data_dir)
+    monkeypatch.setattr(stores, 'commit_sidecar', phi_crypto.commit_sidecar)
+
+    stores._process_cache.clear()
+    loaded = stores.load_stores(data_dir, ['patient_db'])['patient_db']
+    assert loaded['first_name'].tolist() == _patients()['first_name'].iloc[:5].tolist()
+
+
+def test_store_edited_outside_the_app(tmp_path, use_cipher):
+    data_dir = str(tmp_path)
+    path = stores.store_path('patient_db', data_dir)
+    use_cipher(_cipher())
+    stores.save_store('patient_db', _patients(), data_dir)
+
+    # A row appended to the sealed file cannot be matched to its identifiers
+    with open(path) as f:
+        sealed = f.read()
+    with open(path, 'a') as f:
+        f.write(sealed.splitlines()[-1] + '\n')
+    stores._process_cache.clear()
+    with pytest.raises(stores.StoreUnavailableError):
+        stores.load_stores(data_dir, ['patient_db'])
+
+    # A plaintext rewrite (e.g. data_generator.py) is the current data and is sealed again
+    _patients().iloc[:4].to_csv(path, index=False)
+    stores._process_cache.clear()
+    loaded = stores.load_stores(data_dir, ['patient_db'])['patient_db']
+    assert loaded['first_name'].tolist() == ['first0', 'first1', 'first2', 'first3']
+    with open(path) as f:
+        assert 'first_name' not in f.readline()